@@ -0,0 +1,109 @@
+"""Benchmark of the getRoot tree load latency against the size of the tree.
+
+Run from the repository root: python benchmarks/getroot_latency.py
+It works in a temporary directory and calls getRoot through Ice, with local
+User and Authentication servants that count the remote calls they receive.
+Those must not grow with the number of directories.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import Ice
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import IceDrive  # noqa: E402
+from icedrive_directory.directory import DirectoryService  # noqa: E402
+from icedrive_directory.discovery import Discovery  # noqa: E402
+from icedrive_directory.locator import DirectoryLocator  # noqa: E402
+
+
+class CountingUser(IceDrive.User):
+    """User servant that counts the calls it receives."""
+
+    def __init__(self, username):
+        """Create the user"""
+        self.username = username
+        self.calls = 0
+
+    def getUsername(self, current: Ice.Current = None) -> str:
+        """Return the username."""
+        self.calls += 1
+        return self.username
+
+    def isAlive(self, current: Ice.Current = None) -> bool:
+        """The user is always alive."""
+        self.calls += 1
+        return True
+
+    def refresh(self, current: Ice.Current = None) -> None:
+        """Nothing to refresh."""
+        self.calls += 1
+
+
+class CountingAuthentication(IceDrive.Authentication):
+    """Authentication servant that accepts every user and counts the verifications."""
+
+    def __init__(self):
+        """Create the servant"""
+        self.calls = 0
+
+    def verifyUser(self, user: IceDrive.UserPrx, current: Ice.Current = None) -> bool:
+        """Every user is valid."""
+        self.calls += 1
+        return True
+
+
+def build(name, username, size, fanout=10):
+    """Build the serialized form of a tree with size directories"""
+    nodes = [{'name': name, 'user': username, 'childs': {}, 'files': {}}]
+    pending = [nodes[0]]
+    while len(nodes) < size:
+        parent = pending.pop(0)
+        for i in range(min(fanout, size - len(nodes))):
+            child = {'name': f'd{i}', 'user': username, 'childs': {}, 'files': {'file': 'blob'}}
+            parent['childs'][child['name']] = child
+            nodes.append(child)
+            pending.append(child)
+    return nodes[0]
+
+
+def main():
+    """Time getRoot on trees of growing size, each one loaded by a service with cold caches"""
+    os.chdir(tempfile.mkdtemp())
+    with Ice.initialize(sys.argv) as communicator:
+        stubs = communicator.createObjectAdapterWithEndpoints('Stubs', 'tcp -h 127.0.0.1')
+        stubs.activate()
+        authentication = CountingAuthentication()
+        Discovery.authenticators.announce(IceDrive.AuthenticationPrx.uncheckedCast(stubs.addWithUUID(authentication)))
+
+        print(f"{'directories':>12} {'getRoot ms':>12} {'User calls':>11} {'Auth calls':>11}")
+        for size in (10, 100, 1000, 10000):
+            service = DirectoryService()  # Cold RootCache and session caches
+            username = f'user{size}'
+            uuid = service.genUUID(username)
+            with open(os.path.join(service.dataDir, f'{uuid}.json'), 'w', encoding='utf-8') as json_file:
+                json.dump(build('root', username, size), json_file)
+
+            adapter = communicator.createObjectAdapterWithEndpoints(f'Directory{size}', 'tcp -h 127.0.0.1')
+            adapter.addServantLocator(service.locator, DirectoryLocator.CATEGORY)
+            adapter.activate()
+            directory = IceDrive.DirectoryServicePrx.uncheckedCast(adapter.addWithUUID(service))
+            user = CountingUser(username)
+            user_prx = IceDrive.UserPrx.uncheckedCast(stubs.addWithUUID(user))
+            authentication.calls = 0
+
+            start = time.perf_counter()
+            directory.getRoot(user_prx)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'{size:>12} {elapsed:>12.2f} {user.calls:>11} {authentication.calls:>11}')
+            adapter.destroy()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
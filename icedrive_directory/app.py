@@ -1,8 +1,9 @@
 """Directory service application."""
 
 import logging
+import os
 import sys
-import time
+import threading
 from typing import List
 
 import Ice
@@ -10,7 +11,10 @@ import IceDrive
 import IceStorm
 
 from icedrive_directory.directory import DirectoryService
-from icedrive_directory.discovery import Discovery
+from icedrive_directory.delayed_response import DirectoryQuery
+from icedrive_directory.discovery import Announcer, Discovery
+from icedrive_directory.locator import DirectoryLocator
+from icedrive_directory.replication import DirectoryReplica
 
 
 class DirectoryApp(Ice.Application):
@@ -19,41 +23,117 @@ class DirectoryApp(Ice.Application):
     def run(self, args: List[str]) -> int:
         """Execute the code for the Directory class."""
         # Directory
+        properties = self.communicator().getProperties()
+        self.sizeThreadPool(properties, "DirectoryAdapter.ThreadPool", 1, 4)  # Dispatch of Directory calls
+        self.sizeThreadPool(properties, "Ice.ThreadPool.Client", 1, 2)  # Replies and AMI callbacks
         adapter = self.communicator().createObjectAdapter("DirectoryAdapter")  # Obj adapter
         adapter.activate()  # Activate adapter
-        servant = DirectoryService()  # Create DirectoryService
-        servant_proxy = adapter.addWithUUID(servant)  # Proxy for directory servant (add to adapter)
+        servant = DirectoryService(properties)  # Create DirectoryService
+        adapter.addServantLocator(servant.locator, DirectoryLocator.CATEGORY)  # Resolves Directory proxies
+        identity = properties.getProperty('Directory.Identity')  # Fixed for the workers of a supervisor
+        if identity:
+            servant_proxy = adapter.add(servant, Ice.stringToIdentity(identity))
+        else:
+            servant_proxy = adapter.addWithUUID(servant)  # Proxy for directory servant (add to adapter)
+        adapter.addFacet(DirectoryReplica(servant.replicas), servant_proxy.ice_getIdentity(),
+                         DirectoryService.REPLICA_FACET)  # Receives the trees we are a backup of
         logging.info("Proxy: %s", servant_proxy)
+        worker = properties.getPropertyAsIntWithDefault('Directory.Worker', -1) >= 0  # Reached via supervisor
 
         # Discovery
         tp_manager = self.communicator().propertyToProxy('IceStorm.TopicManager.Proxy')
         tp_manager = IceStorm.TopicManagerPrx.checkedCast(tp_manager)
-        
-        properties = self.communicator().getProperties()
-        tp_name = properties.getProperty('DiscoveryTopic')  # Get topic name from config
-        try:  # Get the topic
-            discovery_tp = tp_manager.retrieve(tp_name)
-        except IceStorm.NoSuchTopic:  # Create the topic if it doesn't exist
-            discovery_tp = tp_manager.create(tp_name)
+        intervals = self.announceIntervals(properties)
 
-        discovery_publisher = discovery_tp.getPublisher()  # Obtain the publisher for the topic
-        discovery = IceDrive.DiscoveryPrx.uncheckedCast(discovery_publisher)  # Create a proxy for the discovery service
+        # Announcements and queries are served by their own adapter and thread pool, so bursts of
+        # control traffic never take the dispatch threads of the Directory calls
+        discovery_adapter = self.communicator().createObjectAdapter("DiscoveryAdapter")
+        discovery_adapter.activate()
+        discovery_tp, subscriber = self.subscribe(tp_manager, properties.getProperty('DiscoveryTopic'),
+                                                  discovery_adapter, Discovery())
+        discovery = IceDrive.DiscoveryPrx.uncheckedCast(
+            discovery_tp.getPublisher().ice_oneway())  # Announcements need no reply
 
-        qos = {}
-        listener = Discovery()
-        listenerprx = adapter.addWithUUID(listener)
-        subscriber = IceStorm.TopicPrx.uncheckedCast(listenerprx)
-        discovery_tp.subscribeAndGetPublisher(qos, subscriber)
+        # Queries about the trees stored by each instance
+        query_tp, query_listener = self.subscribe(tp_manager, properties.getProperty('DirectoryQueryTopic'),
+                                                  discovery_adapter, DirectoryQuery(servant, adapter))
+        servant.setQueryTopic(query_tp.getPublisher(), discovery_adapter)  # Response servants
 
+        announcer = None
         directory = IceDrive.DirectoryServicePrx.uncheckedCast(servant_proxy)
-        while True:  # Repeat infinitely
-            discovery.announceDirectoryService(prx=directory)  # Announce ourselves
-            time.sleep(5)  # Wait 5 seconds before repeating again
-        
+        if not worker:  # The supervisor is the one in the ring
+            servant.proxy = directory  # Finds itself in the ring of announced instances
+            announcer = Announcer(lambda: discovery.announceDirectoryService(prx=directory),  # Announce ourselves
+                                  **intervals)
+            announcer.start()
+        else:  # Our place in the ring is the one of the supervisor, which routes replicas to us
+            servant.proxy = IceDrive.DirectoryServicePrx.uncheckedCast(
+                self.communicator().stringToProxy(properties.getProperty('Directory.Supervisor')))
+
+        stopped = threading.Event()
+        stats_interval = properties.getPropertyAsIntWithDefault('Directory.Stats.Interval', 60000) / 1000
+        if stats_interval > 0:  # The balancer figures explain why a backend is avoided, while it happens
+            threading.Thread(target=self.logStats, args=(servant, stats_interval, stopped),
+                             name='Stats', daemon=True).start()
+
         self.shutdownOnInterrupt()
         self.communicator().waitForShutdown()
+
+        stopped.set()
+        if announcer is not None:
+            announcer.stop()
+        self.unsubscribe((discovery_tp, subscriber), (query_tp, query_listener))
+        servant.shutdown()  # Send pending mutations and write back every loaded tree
         return 0
 
+    @staticmethod
+    def announceIntervals(properties) -> dict:
+        """Return the Announcer intervals (seconds), setting the expiry of the services"""
+        interval = properties.getPropertyAsIntWithDefault('Directory.Discovery.AnnounceInterval', 5000) / 1000
+        min_interval = properties.getPropertyAsIntWithDefault('Directory.Discovery.MinAnnounceInterval', 500) / 1000
+        max_interval = properties.getPropertyAsIntWithDefault('Directory.Discovery.MaxAnnounceInterval', 60000) / 1000
+        factor = properties.getPropertyAsIntWithDefault('Directory.Discovery.ExpiryFactor', 3)
+        Discovery.setTimeToLive(interval * (1 + Announcer.JITTER) * factor)  # A few missed announcements
+        return {'minInterval': min_interval, 'interval': interval, 'maxInterval': max_interval,
+                'expiryFactor': factor}  # The Announcer scales the expiry of directory services
+
+    @staticmethod
+    def logStats(servant, interval, stopped):
+        """Log the stats of the service every interval seconds until stopped is set"""
+        while not stopped.wait(interval):
+            logging.info('Directory service stats: %s', servant.stats())
+
+    @staticmethod
+    def subscribe(tp_manager, tp_name, adapter, listener):
+        """Subscribe a servant to a topic (created if it doesn't exist), returning (topic, subscriber)"""
+        try:  # Get the topic
+            topic = tp_manager.retrieve(tp_name)
+        except IceStorm.NoSuchTopic:  # Create the topic if it doesn't exist
+            topic = tp_manager.create(tp_name)
+        subscriber = adapter.addWithUUID(listener)
+        topic.subscribeAndGetPublisher({}, subscriber)
+        return topic, subscriber
+
+    @staticmethod
+    def unsubscribe(*subscriptions):
+        """Remove the (topic, subscriber) subscriptions, on shutdown"""
+        for topic, subscriber in subscriptions:
+            try:
+                topic.unsubscribe(subscriber)
+            except Ice.LocalException as e:
+                logging.warning('Could not unsubscribe from %s: %s', topic, e)
+
+    @staticmethod
+    def sizeThreadPool(properties, prefix, perCore, maxPerCore):
+        """Fill in the thread pool sizes missing from the configuration from the number of cores"""
+        cores = os.cpu_count() or 1
+        size = properties.getPropertyAsIntWithDefault(prefix + ".Size", cores * perCore)
+        size_max = properties.getPropertyAsIntWithDefault(prefix + ".SizeMax", max(size, cores * maxPerCore))
+        properties.setProperty(prefix + ".Size", str(size))
+        properties.setProperty(prefix + ".SizeMax", str(size_max))
+        properties.setProperty(prefix + ".SizeWarn", str(properties.getPropertyAsIntWithDefault(
+            prefix + ".SizeWarn", size_max * 4 // 5)))  # Logged when the pool is nearly exhausted
+
 
 def main():
     """Handle the icedrive-authentication program."""
@@ -0,0 +1,93 @@
+"""Latency-aware selection among the replicas of a discovered service."""
+
+import threading
+import time
+
+
+class Backend:
+    """Load figures of one replica."""
+
+    def __init__(self, prx):
+        """Create the figures of a replica not called yet"""
+        self.prx = prx
+        self.latency = None  # EWMA of the call latency (seconds), None until the first reply
+        self.inflight = 0  # Calls sent and not answered yet
+        self.calls = 0
+        self.failures = 0
+
+    def cost(self, default) -> float:
+        """Expected wait of a new call: latency times the calls it queues behind"""
+        latency = default if self.latency is None else self.latency
+        return latency * (self.inflight + 1)
+
+    def stats(self) -> dict:
+        """Return the figures as a dict"""
+        return {'latencyMs': None if self.latency is None else round(self.latency * 1000, 3),
+                'inflight': self.inflight, 'calls': self.calls, 'failures': self.failures}
+
+
+class Balancer:
+    """Tracks the latency and in-flight calls of each replica and picks the least loaded of two.
+
+    Callers wrap each invocation in begin()/end(); choose() gets two random
+    candidates (power of two choices) and returns the one with the lowest
+    EWMA latency x (in-flight + 1). Replicas without replies yet are costed
+    at the mean latency of the others, so new ones are tried soon.
+    """
+
+    def __init__(self, alpha=0.3):
+        """Create the balancer, alpha is the weight of the newest sample in the EWMA"""
+        self.alpha = alpha
+        self.backends = {}  # Identity -> Backend
+        self.lock = threading.Lock()
+
+    def backend(self, prx) -> Backend:
+        """Return the figures of a replica, creating them if needed (lock must be held)"""
+        identity = prx.ice_getIdentity()
+        backend = self.backends.get(identity)
+        if backend is None:
+            backend = self.backends[identity] = Backend(prx)
+        return backend
+
+    def choose(self, first, second):
+        """Return the cheaper of two candidates (either may be None)"""
+        if first is None or second is None or first == second:
+            return first or second
+        with self.lock:
+            known = [backend.latency for backend in self.backends.values() if backend.latency is not None]
+            default = sum(known) / len(known) if known else 0.0
+            if self.backend(second).cost(default) < self.backend(first).cost(default):
+                return second
+            return first
+
+    def begin(self, prx) -> float:
+        """Record a call sent to a replica, returning its start time for end()"""
+        with self.lock:
+            backend = self.backend(prx)
+            backend.inflight += 1
+            backend.calls += 1
+        return time.monotonic()
+
+    def end(self, prx, started, ok=True):
+        """Record the reply (or failure) of a call started with begin()"""
+        elapsed = time.monotonic() - started
+        with self.lock:
+            backend = self.backend(prx)
+            backend.inflight = max(0, backend.inflight - 1)
+            if not ok:
+                backend.failures += 1
+                return
+            if backend.latency is None:
+                backend.latency = elapsed
+            else:
+                backend.latency += self.alpha * (elapsed - backend.latency)
+
+    def forget(self, identity):
+        """Drop the figures of a replica that left"""
+        with self.lock:
+            self.backends.pop(identity, None)
+
+    def stats(self) -> dict:
+        """Return the figures of every replica, keyed by proxy"""
+        with self.lock:
+            return {str(backend.prx): backend.stats() for backend in self.backends.values()}
@@ -0,0 +1,289 @@
+"""Outbound queue of link/unlink requests toward the Blob services."""
+
+import collections
+import logging
+import threading
+import time
+
+import Ice
+import IceDrive
+
+from icedrive_directory.discovery import Discovery
+from icedrive_directory.futures import forward
+
+
+class BlobQueue:
+    """Coalesces the link/unlink requests sent to the Blob services.
+
+    Each request is assigned to a lightly loaded BlobService when queued and
+    waits in the lane of that service up to window seconds (or until maxBatch
+    are queued there), then the lane is sent back to back. A request still
+    queued can be called off with cancel(), so a link undone before it leaves
+    (e.g. a temporary file) never reaches the service. Requests failing with
+    a local exception (the replica is down or unreachable) are retried on a
+    different replica, and requests still unanswered after a percentile of
+    the recent latencies are hedged on a second replica (see Request).
+    """
+
+    MIN_SAMPLES = 20  # Replies needed before the hedging delay follows the percentile
+    RECOMPUTE_EVERY = 16  # Replies between recomputations of the percentile
+
+    def __init__(self, window=0.01, maxBatch=100, retries=2, percentile=95, initialDelay=0.05):
+        """Create the queue (percentile 0 disables hedging)"""
+        self.window = window
+        self.maxBatch = maxBatch
+        self.retries = retries
+        self.percentile = percentile
+        self.initialDelay = initialDelay
+        self.latencies = collections.deque(maxlen=256)  # Recent reply latencies (seconds)
+        self.samples = 0
+        self.delay = None  # Cached percentile of latencies
+        self.discovery = Discovery()
+        self.lanes = {}  # Identity of a Blob service -> Lane with its queued requests
+        self.queued = {}  # Future of a queued request -> its Lane, to cancel it
+        self.size = 0
+        self.counters = {'sent': 0, 'cancelled': 0, 'retried': 0, 'hedged': 0, 'compensated': 0}
+        self.lock = threading.Lock()
+
+    def link(self, blob_id, future=None) -> Ice.Future:
+        """Queue the link of a blob"""
+        return self.enqueue('link', blob_id, future)
+
+    def unlink(self, blob_id, future=None) -> Ice.Future:
+        """Queue the unlink of a blob"""
+        return self.enqueue('unlink', blob_id, future)
+
+    def enqueue(self, operation, blob_id, future=None) -> Ice.Future:
+        """Add a request to the lane of a Blob service, raising TemporaryUnavailable if there is none.
+
+        The request completes future (a new one if None), which is returned.
+        """
+        prx = self.discovery.selectBlob()
+        if prx is None:
+            raise IceDrive.TemporaryUnavailable('Blob Service')
+
+        future = future if future is not None else Ice.Future()
+        full = None
+        with self.lock:
+            lane = self.lanes.get(prx.ice_getIdentity())
+            if lane is None:
+                lane = self.lanes[prx.ice_getIdentity()] = Lane(prx)
+            lane.requests[future] = (operation, blob_id)
+            self.queued[future] = lane
+            self.size += 1
+            if len(lane.requests) >= self.maxBatch:
+                full = lane
+            elif lane.timer is None:
+                lane.timer = threading.Timer(self.window, self.flushLane, args=(lane,))
+                lane.timer.daemon = True
+                lane.timer.start()
+
+        if full is not None:
+            self.flushLane(full)
+        return future
+
+    def cancel(self, future) -> bool:
+        """Call off a request that has not been sent yet, completing its future with InvocationCanceledException.
+
+        Returns False if it already left (or was never queued), then it will complete normally.
+        """
+        with self.lock:
+            lane = self.queued.pop(future, None)
+            if lane is None:
+                return False
+            del lane.requests[future]
+            self.size -= 1
+            self.counters['cancelled'] += 1
+            if not lane.requests:
+                self.detach(lane)
+        future.set_exception(Ice.InvocationCanceledException())
+        return True
+
+    def flush(self):
+        """Send the requests queued in every lane"""
+        with self.lock:
+            lanes = list(self.lanes.values())
+        for lane in lanes:
+            self.flushLane(lane)
+
+    def flushLane(self, lane):
+        """Send the requests of a lane to its Blob service, hedging the slow ones on another"""
+        with self.lock:
+            if self.lanes.get(lane.prx.ice_getIdentity()) is not lane:  # Already sent
+                return
+            self.detach(lane)
+            for future in lane.requests:
+                del self.queued[future]
+            self.size -= len(lane.requests)
+
+        sent = []
+        for future, (operation, blob_id) in lane.requests.items():
+            request = Request(self, operation, blob_id, future)
+            request.send(lane.prx)
+            sent.append(request)
+
+        if self.percentile and self.discovery.selectBlob(exclude=[lane.prx]) is not None:
+            hedge = threading.Timer(self.hedgeDelay(), lambda: [request.hedge() for request in sent])
+            hedge.daemon = True  # One timer per batch, not per request
+            hedge.start()
+
+    def detach(self, lane):
+        """Remove a lane from the queue, the next request to its service opens a new one (lock must be held)"""
+        if lane.timer is not None:
+            lane.timer.cancel()
+            lane.timer = None
+        del self.lanes[lane.prx.ice_getIdentity()]
+
+    def hedgeDelay(self) -> float:
+        """Seconds to wait before hedging: the configured percentile of the recent reply latencies"""
+        with self.lock:
+            if len(self.latencies) < self.MIN_SAMPLES:
+                return self.initialDelay
+            if self.delay is None:
+                ordered = sorted(self.latencies)
+                self.delay = ordered[min(len(ordered) - 1, len(ordered) * self.percentile // 100)]
+            return self.delay
+
+    def replied(self, elapsed):
+        """Record the latency of a successful request"""
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.samples += 1
+            if self.samples % self.RECOMPUTE_EVERY == 0:
+                self.delay = None
+
+    def count(self, counter):
+        """Increment one of the counters"""
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> dict:
+        """Return a copy of the counters"""
+        with self.lock:
+            return dict(self.counters, queued=self.size, lanes=len(self.lanes))
+
+
+class Lane:
+    """Requests queued for one Blob service, sent together when the window expires"""
+
+    def __init__(self, prx):
+        """Create an empty lane toward prx"""
+        self.prx = prx
+        self.requests = {}  # Future -> (operation, blob_id), in arrival order
+        self.timer = None
+
+
+class Request:
+    """One link/unlink, sent to a Blob service and possibly hedged on a second one.
+
+    The first reply wins and completes the future. A losing invocation that
+    has not left the process yet is cancelled. One that was already sent
+    can't be recalled, so if it succeeds as well its effect is undone (an
+    unlink for a link and vice versa) to keep the reference count right.
+    """
+
+    def __init__(self, queue, operation, blob_id, future):
+        """Create the request"""
+        self.queue = queue
+        self.operation = operation
+        self.blob_id = blob_id
+        self.future = future
+        self.outstanding = []  # (proxy, invocation) not answered yet
+        self.failed = []  # Replicas that failed it with a local exception
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def send(self, prx):
+        """Send the request to a replica (None if there is no Blob service)"""
+        if prx is None:
+            with self.lock:
+                self.finished = True
+            self.future.set_exception(IceDrive.TemporaryUnavailable('Blob Service'))
+            return
+        self.queue.count('sent')
+        balancer = Discovery.blobs.balancer
+        started = balancer.begin(prx)
+        try:
+            invocation = prx.linkAsync(self.blob_id) if self.operation == 'link' else prx.unlinkAsync(self.blob_id)
+        except Ice.LocalException as e:
+            balancer.end(prx, started, ok=False)
+            self.fail(prx, e)
+            return
+        with self.lock:
+            self.outstanding.append((prx, invocation))
+        invocation.add_done_callback(lambda result: self.done(prx, started, result))
+
+    def hedge(self):
+        """Send a second copy to another replica if the first has not answered yet"""
+        with self.lock:
+            if self.finished or not self.outstanding or len(self.outstanding) > 1:
+                return
+            busy = self.failed + [prx for prx, _ in self.outstanding]
+        other = self.queue.discovery.selectBlob(exclude=busy)
+        if other is not None:
+            self.queue.count('hedged')
+            self.send(other)
+
+    def done(self, prx, started, result):
+        """Handle the reply of one of the invocations"""
+        balancer = Discovery.blobs.balancer
+        ok = True
+        try:
+            result.result()
+        except Ice.InvocationCanceledException:  # Lost the race before being sent
+            balancer.end(prx, started, ok=False)
+            self.forget(result)
+            return
+        except Ice.LocalException as e:
+            balancer.end(prx, started, ok=False)
+            self.forget(result)
+            self.fail(prx, e)
+            return
+        except Exception:  # A user exception is a reply too
+            ok = False
+        balancer.end(prx, started)
+        self.queue.replied(time.monotonic() - started)
+
+        with self.lock:
+            self.outstanding = [call for call in self.outstanding if call[1] is not result]
+            first, self.finished = not self.finished, True
+            losers = self.outstanding if first else []
+        if first:
+            for _, invocation in losers:
+                if not invocation.is_sent():
+                    invocation.cancel()
+            forward(result, self.future)
+        elif ok:
+            self.compensate(prx)
+
+    def compensate(self, prx):
+        """Undo a request that also succeeded on the losing replica"""
+        logging.info('Hedged %s of %s succeeded twice, undoing it on %s', self.operation, self.blob_id, prx)
+        self.queue.count('compensated')
+        try:
+            prx.unlinkAsync(self.blob_id) if self.operation == 'link' else prx.linkAsync(self.blob_id)
+        except Ice.LocalException as e:
+            logging.warning('Could not undo %s of %s on %s: %s', self.operation, self.blob_id, prx, e)
+
+    def forget(self, result):
+        """Drop an invocation that will not reply"""
+        with self.lock:
+            self.outstanding = [call for call in self.outstanding if call[1] is not result]
+
+    def fail(self, prx, error):
+        """Resend a request to a replica that has not failed it yet, unless another copy is still running"""
+        with self.lock:
+            self.failed.append(prx)
+            if self.finished or self.outstanding:
+                return
+            if len(self.failed) > self.queue.retries:
+                self.finished = True
+                retry = False
+            else:
+                retry = True
+        if not retry:
+            self.future.set_exception(error)
+            return
+        logging.warning('Blob service %s failed (%s), retrying %s of %s', prx, error, self.operation, self.blob_id)
+        self.queue.count('retried')
+        self.send(self.queue.discovery.selectBlob(exclude=self.failed))
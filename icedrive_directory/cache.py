@@ -0,0 +1,332 @@
+"""Caches shared by the Directory service servants."""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import Ice
+
+from icedrive_directory.futures import completed, then, whenAll
+
+
+class Session:
+    """Liveness state of one session (User proxy) of a user."""
+
+    REFRESH_AHEAD = 0.25  # Fraction of the TTL left when a background refresh is started
+
+    def __init__(self, cache, prx):
+        """Create the entry for the given User proxy"""
+        self.cache = cache
+        self.prx = prx
+        self.alive = None  # Unknown until the first check
+        self.expires = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def isAlive(self) -> bool:
+        """Return the liveness of the session, asking the Authentication service only on a miss"""
+        alive = self.lookup()
+        if alive is not None:
+            return alive
+        self.cache.count('misses')
+        return self.store(self.prx.isAlive())  # Synchronous call, nothing valid is cached
+
+    def isAliveAsync(self) -> Ice.Future:
+        """Like isAlive(), but returns a future instead of blocking on a miss"""
+        alive = self.lookup()
+        if alive is not None:
+            return completed(alive)
+        self.cache.count('misses')
+        return then(self.prx.isAliveAsync(), self.store)
+
+    def lookup(self):
+        """Return the cached liveness or None, renewing hot entries in background"""
+        now = time.monotonic()
+        refresh = False
+        with self.lock:
+            alive = self.alive
+            if alive is not None and now < self.expires:
+                if alive and not self.refreshing and self.expires - now < self.cache.ttl * self.REFRESH_AHEAD:
+                    self.refreshing = refresh = True  # Renew before expiring so hot users never block
+            else:
+                alive = None
+
+        if alive is not None:
+            self.cache.count('hits')
+            if refresh:
+                self.refreshAsync()
+        return alive
+
+    def refreshAsync(self):
+        """Ask the Authentication service in background"""
+        self.cache.count('refreshes')
+        try:
+            future = self.prx.isAliveAsync()
+        except Exception as e:
+            logging.warning('Background liveness refresh failed: %s', e)
+            with self.lock:
+                self.refreshing = False
+            return
+        future.add_done_callback(self.refreshDone)
+
+    def refreshDone(self, future):
+        """Store the result of a background refresh"""
+        try:
+            alive = future.result()
+        except Exception as e:  # Let the entry expire, the next call will retry synchronously
+            logging.warning('Background liveness refresh failed: %s', e)
+            with self.lock:
+                self.refreshing = False
+            return
+        self.store(alive)
+
+    def store(self, alive):
+        """Save a liveness answer"""
+        ttl = self.cache.ttl if alive else self.cache.negativeTtl
+        with self.lock:
+            self.alive = alive
+            self.expires = time.monotonic() + ttl
+            self.refreshing = False
+        if not alive and self.cache.onDead is not None:
+            self.cache.onDead(self.prx)
+        return alive
+
+
+class CachedUser:
+    """Liveness of one user, shared by every Directory node of its tree.
+
+    Directory calls do not tell which session made them, so the user is
+    alive while any of its recent sessions is: one session logging out does
+    not lock out the others, and an expired one does not keep the tree open
+    once every session is dead.
+    """
+
+    MAX_SESSIONS = 16  # Most recent sessions kept per user
+
+    def __init__(self, cache):
+        """Create the entry, without sessions"""
+        self.cache = cache
+        self.sessions = OrderedDict()  # Identity -> Session, least recently seen first
+        self.lock = threading.Lock()
+
+    def session(self, prx) -> Session:
+        """Return the entry of a session of the user, adding it if new"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            session = self.sessions.get(identity)
+            if session is None:
+                session = self.sessions[identity] = Session(self.cache, prx)
+                while len(self.sessions) > self.MAX_SESSIONS:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(identity)
+            return session
+
+    def isAlive(self) -> bool:
+        """Check if some session is alive, from the cache first and then asking for the unknown ones"""
+        with self.lock:
+            sessions = list(reversed(self.sessions.values()))  # Most recent first
+        unknown = []
+        for session in sessions:
+            alive = session.lookup()
+            if alive:
+                return True
+            if alive is None:
+                unknown.append(session)
+        return any(session.isAlive() for session in unknown)
+
+    def isAliveAsync(self) -> Ice.Future:
+        """Like isAlive(), but asks for every unknown session at once and returns a future instead of blocking"""
+        with self.lock:
+            sessions = list(reversed(self.sessions.values()))
+        unknown = []
+        for session in sessions:
+            alive = session.lookup()
+            if alive:
+                return completed(True)
+            if alive is None:
+                unknown.append(session)
+
+        def answered(futures):
+            if any(future.exception() is None and future.result() for future in futures):
+                return True
+            for future in futures:  # None alive: a failed check is not a "no"
+                if future.exception() is not None:
+                    raise future.exception()
+            return False
+        return then(whenAll(session.isAliveAsync() for session in unknown), answered)
+
+    def __len__(self):
+        """Number of sessions kept"""
+        return len(self.sessions)
+
+
+class LivenessCache:
+    """Per-session cache of User.isAlive() answers with positive and negative TTLs, grouped by user.
+
+    The users are kept in LRU order, at most maxUsers of them, and dropped
+    once idle for idleTtl seconds. A loaded tree keeps the entry it was
+    given, so dropping it here only frees the users nobody refers to.
+    """
+
+    def __init__(self, ttl=5.0, negativeTtl=1.0, onDead=None, maxUsers=1000, idleTtl=60.0):
+        """Create the cache (TTLs in seconds), onDead(prx) is called when a session is found not alive"""
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.onDead = onDead
+        self.maxUsers = maxUsers
+        self.idleTtl = idleTtl
+        self.users = OrderedDict()  # Username -> (CachedUser, expiry time), least recently used first
+        self.counters = {'hits': 0, 'misses': 0, 'refreshes': 0}
+        self.lock = threading.Lock()
+
+    def get(self, username, prx) -> CachedUser:
+        """Return the shared entry of a user, registering prx as one of its sessions"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(username)
+            user = CachedUser(self) if entry is None else entry[0]  # Reused even if idle, a tree may share it
+            self.users[username] = (user, now + self.idleTtl)
+            self.users.move_to_end(username)
+            while len(self.users) > 1 and (len(self.users) > self.maxUsers or
+                                           next(iter(self.users.values()))[1] <= now):
+                self.users.popitem(last=False)
+        user.session(prx)
+        return user
+
+    def forget(self, username):
+        """Drop the entry of a user (its tree was unloaded)"""
+        with self.lock:
+            self.users.pop(username, None)
+
+    def count(self, counter):
+        """Increment one of the hit/miss counters"""
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> dict:
+        """Return a copy of the hit/miss counters"""
+        with self.lock:
+            return dict(self.counters, users=len(self.users),
+                        sessions=sum(len(user) for user, _ in self.users.values()))
+
+
+class VerifiedCache:
+    """LRU cache of the User proxies verified by an Authentication service, with their usernames.
+
+    Keyed by the proxy identity, which is unique per session, so a getRoot
+    hit needs neither getUsername() nor verifyUser(). Entries expire after
+    ttl seconds and are dropped as soon as the user is found not alive.
+    """
+
+    def __init__(self, maxUsers=1000, ttl=60.0):
+        """Create the cache (TTL in seconds)"""
+        self.maxUsers = maxUsers
+        self.ttl = ttl
+        self.users = OrderedDict()  # Identity -> (username, expiry time), least recently used first
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def get(self, prx):
+        """Return the username of a verified User proxy, None if it has to be verified"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            entry = self.users.get(identity)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self.users[identity]
+                self.counters['misses'] += 1
+                return None
+            self.users.move_to_end(identity)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, prx, username):
+        """Remember that a User proxy was verified"""
+        with self.lock:
+            self.users[prx.ice_getIdentity()] = (username, time.monotonic() + self.ttl)
+            self.users.move_to_end(prx.ice_getIdentity())
+            while len(self.users) > self.maxUsers:
+                self.users.popitem(last=False)
+
+    def invalidate(self, prx):
+        """Forget a User proxy (its session ended)"""
+        with self.lock:
+            if self.users.pop(prx.ice_getIdentity(), None) is not None:
+                self.counters['invalidations'] += 1
+
+    def stats(self) -> dict:
+        """Return a copy of the hit/miss counters"""
+        with self.lock:
+            return dict(self.counters, users=len(self.users))
+
+
+class RootCache:
+    """LRU cache of the loaded user trees, bounded by number of trees and of directories."""
+
+    def __init__(self, maxTrees=100, maxNodes=100000, onEvict=None):
+        """Create the cache, onEvict(uuid, root) is called for every evicted tree and returns False if it is busy"""
+        self.maxTrees = maxTrees
+        self.maxNodes = maxNodes
+        self.onEvict = onEvict
+        self.trees = OrderedDict()  # User UUID -> root Directory, least recently used first
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+
+    def get(self, uuid):
+        """Return the loaded tree of a user, or None"""
+        with self.lock:
+            root = self.trees.get(uuid)
+            if root is None:
+                self.counters['misses'] += 1
+                return None
+            self.trees.move_to_end(uuid)
+            self.counters['hits'] += 1
+            return root
+
+    def peek(self, uuid):
+        """Return the loaded tree of a user, or None, without counting the lookup nor making it recent"""
+        with self.lock:
+            return self.trees.get(uuid)
+
+    def put(self, uuid, root):
+        """Add a loaded tree, evicting the least recently used ones if over the limits"""
+        evicted = []
+        with self.lock:
+            self.trees[uuid] = root
+            self.trees.move_to_end(uuid)
+            nodes = sum(tree.nodes for tree in self.trees.values())
+            while len(self.trees) > 1 and (len(self.trees) > self.maxTrees or nodes > self.maxNodes):
+                old_uuid, old_root = self.trees.popitem(last=False)
+                nodes -= old_root.nodes
+                evicted.append((old_uuid, old_root))
+            self.counters['evictions'] += len(evicted)
+
+        for old_uuid, old_root in evicted:  # Write back outside the lock
+            logging.info('Evicting tree of %s (%d directories)', old_uuid, old_root.nodes)
+            if self.onEvict is not None and self.onEvict(old_uuid, old_root) is False:
+                logging.info('Tree of %s is busy, keeping it', old_uuid)
+                with self.lock:  # Back as the least recently used, the next put tries again
+                    self.trees[old_uuid] = old_root
+                    self.trees.move_to_end(old_uuid, last=False)
+                    self.counters['evictions'] -= 1
+
+    def clear(self):
+        """Evict every tree, calling onEvict for each of them"""
+        with self.lock:
+            evicted, self.trees = list(self.trees.items()), OrderedDict()
+            self.counters['evictions'] += len(evicted)
+        for uuid, root in evicted:
+            if self.onEvict is not None and self.onEvict(uuid, root) is False:
+                logging.warning('Tree of %s is still busy, it was not written back', uuid)
+
+    def remove(self, uuid):
+        """Drop a tree without calling onEvict, returning it (None if it was not loaded)"""
+        with self.lock:
+            return self.trees.pop(uuid, None)
+
+    def stats(self) -> dict:
+        """Return a copy of the hit/miss counters"""
+        with self.lock:
+            return dict(self.counters, trees=len(self.trees),
+                        nodes=sum(tree.nodes for tree in self.trees.values()))
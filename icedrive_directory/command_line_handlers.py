@@ -1,6 +1,9 @@
 import sys
 
+import Ice
+
 from icedrive_directory.app import DirectoryApp
+from icedrive_directory.supervisor import SupervisorApp
 
 #def client() -> int:
 #    """Handler for the ClientApp"""
@@ -8,6 +11,15 @@ from icedrive_directory.app import DirectoryApp
 #    return app.main(sys.argv)
 
 def server() -> int:
-    """Handler for the DirectoryApp"""
-    app = DirectoryApp()
+    """Handler for the DirectoryApp, a supervisor of several worker processes if Directory.Workers > 1"""
+    properties = Ice.createProperties(list(sys.argv))  # --Ice.Config file plus the --Prop=value overrides
+    if properties.getPropertyAsIntWithDefault('Directory.Workers', 1) > 1 and \
+            properties.getPropertyAsIntWithDefault('Directory.Worker', -1) < 0:  # Workers know their count too
+        app = SupervisorApp(sys.argv)
+    else:
+        app = DirectoryApp()
     return app.main(sys.argv)
+
+
+if __name__ == '__main__':  # Workers are started as python -m icedrive_directory.command_line_handlers
+    sys.exit(server())
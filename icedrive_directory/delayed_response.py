@@ -1,19 +1,150 @@
 """Servant implementation for the delayed response mechanism."""
 
+import logging
+import threading
+from collections import OrderedDict
+
 import Ice
 
 import IceDrive
 
+from icedrive_directory.discovery import Discovery
+from icedrive_directory.futures import then
+
 
 class DirectoryQueryResponse(IceDrive.DirectoryQueryResponse):
     """Query response receiver."""
+    def __init__(self, future: Ice.Future):
+        """Create the receiver of one query, completing future with the first root received"""
+        self.future = future
+        self.lock = threading.Lock()
+
     def rootDirectoryResponse(self, root: IceDrive.DirectoryPrx, current: Ice.Current = None) -> None:
         """Receive a Directory when other service instance knows the user."""
-        # TODO: Send a query to respond with the root of the user (If found) when recieving a request
+        with self.lock:  # First response wins, later ones are ignored
+            if self.future.done():
+                return
+            self.future.set_result(root)
 
 
 class DirectoryQuery(IceDrive.DirectoryQuery):
     """Query receiver."""
-    def rootDirectory(self, user: IceDrive.UserPrx, response: IceDrive.DirectoryQueryResponsePrx, current: Ice.Current = None) -> None:
-        """Receive a query about the user's root directory."""
-        # TODO: Send a request to ask for the root directory object of a user
+    def __init__(self, service, adapter):
+        """Create the receiver, answering with roots served by the given (DirectoryAdapter) adapter"""
+        self.service = service
+        self.adapter = adapter
+
+    def rootDirectory(self, user: IceDrive.UserPrx, response: IceDrive.DirectoryQueryResponsePrx, current: Ice.Current = None) -> Ice.Future:
+        """Receive a query about the user's root directory.
+
+        Anyone can publish on the topic, so the root is only sent back for a
+        user verified by an Authentication service whose session is alive.
+        """
+        queries = self.service.queries
+        if queries is not None and queries.isOwn(response):  # Our own query, echoed by the topic
+            return None
+        user = user.ice_invocationTimeout(self.service.authTimeout)  # A hung caller can't hold our threads
+
+        def gotUsername(username):
+            if not self.service.storesRoot(username):  # Most instances: nothing to verify
+                return None
+            return then(self.service.verifyUser(user, []), lambda valid: verified(username, valid))
+
+        def verified(username, valid):
+            if not valid:
+                raise IceDrive.Unauthorized(username)
+            return then(user.isAliveAsync(), lambda alive: answer(username, alive))
+
+        def answer(username, alive):
+            if not alive:
+                raise IceDrive.Unauthorized(username)
+            root = self.service.localRoot(username, user)  # None if it was removed meanwhile
+            if root is not None:
+                print(f'Answering query for the root of {username}')
+                response.rootDirectoryResponseAsync(root.proxy(self.adapter))
+        return then(user.getUsernameAsync(), gotUsername)
+
+
+class RootQueries:
+    """Scatter-gather lookup of user roots stored by other Directory instances.
+
+    ask() publishes a DirectoryQuery on the topic and completes with the first
+    root received, or with None after timeout seconds. Found roots are cached
+    by user UUID along with the service that owns them, so later lookups go
+    straight to the owner while it keeps announcing itself.
+    """
+
+    def __init__(self, publisher: IceDrive.DirectoryQueryPrx, adapter, timeout=2.0, maxOwners=10000):
+        """Create the lookup, response servants are added to adapter while their query is open"""
+        self.publisher = publisher
+        self.adapter = adapter
+        self.timeout = timeout
+        self.maxOwners = maxOwners
+        self.owners = OrderedDict()  # User UUID -> (root proxy, owning DirectoryService proxy or None)
+        self.pending = set()  # Identities of our open response servants
+        self.lock = threading.Lock()
+
+    def lookup(self, uuid):
+        """Return the cached root of a user stored elsewhere, None if unknown or its owner left"""
+        with self.lock:
+            entry = self.owners.get(uuid)
+            if entry is None:
+                return None
+            root, owner = entry
+            if owner is not None and not Discovery.directories.alive(owner):
+                del self.owners[uuid]
+                return None
+            self.owners.move_to_end(uuid)
+            return root
+
+    def remember(self, uuid, root):
+        """Cache the root of a user together with the service serving it"""
+        endpoints = {str(endpoint) for endpoint in root.ice_getEndpoints()}
+        owner = next((prx for prx in Discovery.directories.proxies()
+                      if endpoints & {str(endpoint) for endpoint in prx.ice_getEndpoints()}), None)
+        with self.lock:
+            self.owners[uuid] = (root, owner)
+            self.owners.move_to_end(uuid)
+            while len(self.owners) > self.maxOwners:
+                self.owners.popitem(last=False)
+
+    def forget(self, uuid):
+        """Drop the cached owner of a user (e.g. the tree is now stored here)"""
+        with self.lock:
+            self.owners.pop(uuid, None)
+
+    def isOwn(self, response) -> bool:
+        """Check if a query was published by this instance"""
+        with self.lock:
+            return response.ice_getIdentity() in self.pending
+
+    def ask(self, uuid, user) -> Ice.Future:
+        """Ask every instance for the root of a user, completing with the first answer or None"""
+        future = Ice.Future()
+        servant = DirectoryQueryResponse(future)
+        response = IceDrive.DirectoryQueryResponsePrx.uncheckedCast(self.adapter.addWithUUID(servant))
+        identity = response.ice_getIdentity()
+        with self.lock:
+            self.pending.add(identity)
+        timer = threading.Timer(self.timeout, lambda: servant.rootDirectoryResponse(None))  # Nobody has it
+        timer.daemon = True
+
+        def closed(result):
+            timer.cancel()
+            with self.lock:
+                self.pending.discard(identity)
+            try:
+                self.adapter.remove(identity)
+            except Ice.NotRegisteredException:
+                pass
+            if result.result() is not None:
+                self.remember(uuid, result.result())
+
+        future.add_done_callback(closed)
+        timer.start()
+        try:
+            self.publisher.rootDirectoryAsync(user, response)
+        except Ice.LocalException as e:
+            logging.warning('Could not publish the root query: %s', e)
+            servant.rootDirectoryResponse(None)
+        return future
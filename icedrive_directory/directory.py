@@ -1,170 +1,534 @@
 """Module for servants implementations."""
 
+from contextlib import contextmanager
 from typing import List
 import os
 import json
+import logging
+import threading
 import uuid as UD
 
 import Ice
 import IceDrive
 
+from icedrive_directory.blobqueue import BlobQueue
+from icedrive_directory.cache import LivenessCache, RootCache, VerifiedCache
 from icedrive_directory.discovery import Discovery
-from icedrive_directory.delayed_response import DirectoryQueryResponse
-from icedrive_directory.delayed_response import DirectoryQuery
+from icedrive_directory.futures import completed, recover, then, whenAll
+from icedrive_directory.journal import Journal
+from icedrive_directory.locator import DirectoryLocator
+from icedrive_directory.replication import ReplicaStore, Replicator
+from icedrive_directory.ring import HashRing
+from icedrive_directory.rwlock import ReadWriteLock
+from icedrive_directory.storage import SqliteDatabase, SqliteStorage, Storage, joinPath, splitPath
+from icedrive_directory.delayed_response import RootQueries
 
 
 class Directory(IceDrive.Directory):
     """Implementation of the IceDrive.Directory interface."""
-    def __init__(self, name, user: IceDrive.UserPrx, parent=None):
+    RESERVED = ('', '.', '..')  # The directory itself and its parent in paths, never the name of a child
+
+    def __init__(self, name, user: IceDrive.UserPrx, parent=None, liveness=None, locator=None, storage=None,
+                 blobs=None, username=None, replicator=None):
         """Create the Directory"""
         self.name = name
         self.userObj = user
-        self.user = self.userObj.getUsername()
         self.parent = parent
+        if parent is not None:  # Shared by the whole tree
+            self.user = parent.user  # No remote call, the username is the same in the whole tree
+            self.liveness = parent.liveness
+            self.locator = parent.locator
+            self.storage = parent.storage
+            self.blobs = parent.blobs
+            self.replicator = parent.replicator
+            self.lock = parent.lock
+            self.root = parent.root
+            self.root.nodes += 1
+            self.uuid = parent.uuid
+            self.path = joinPath(parent.path, name)
+        else:
+            self.liveness = liveness
+            self.locator = locator
+            self.storage = storage
+            self.blobs = blobs
+            self.replicator = replicator
+            self.lock = ReadWriteLock()  # One per tree: many readers or one writer
+            self.materializing = threading.Lock()  # Readers may build the same child at once
+            self.user = username if username is not None else self.userObj.getUsername()
+            self.root = self
+            self.nodes = 1  # Directories in the tree, used to bound the RootCache
+            self.pins = 0  # Requests still waiting for the Blob service, the tree can't be evicted meanwhile
+            self.pinLock = threading.Lock()
+            self.closed = False  # Evicted: its storage is closed and this copy must not change any more
+            self.uuid = self.genUUID(self.user)
+            self.path = ""
         self.childs = {}
         self.files = {}
+        self.linking = {}  # File name -> future of its link, while the Blob service has not confirmed it
+        self.unlinking = set()  # File names whose unlink was sent, until the Blob service answers
         self.dataDir = "./USRDIRS/"
-        self.discovery = Discovery()  # Create the discovery object
 
     def getParent(self, current: Ice.Current = None) -> IceDrive.DirectoryPrx:
         """Return the proxy to the parent directory, if it exists. None in other case."""
-        if self.userObj.isAlive():
-            if self.parent is not None:
-                print(f'Parent of {self.name} requested: {self.parent}')
-                proxy = current.adapter.addWithUUID(self.parent)
-                return IceDrive.DirectoryPrx.uncheckedCast(proxy)
-            raise IceDrive.RootHasNoParent()
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                if self.parent is not None:
+                    print(f'Parent of {self.name} requested: {self.parent}')
+                    return self.parent.proxy(current.adapter)
+                raise IceDrive.RootHasNoParent()
         else:
             raise IceDrive.Unauthorized(self.user)
 
     def getChilds(self, current: Ice.Current = None) -> List[str]:
         """Return a list of names of the directories contained in the directory."""
-        if self.userObj.isAlive():
-            print(f'List of childs of {self.name} requested: {self.childs.keys()}')
-            return list(self.childs.keys())
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                print(f'List of childs of {self.name} requested: {self.childs.keys()}')
+                return list(self.childs.keys())
         else:
             raise IceDrive.Unauthorized(self.user)
 
     def getChild(self, name: str, current: Ice.Current = None) -> IceDrive.DirectoryPrx:
         """Return the proxy to one specific directory inside the current one."""
-        if self.userObj.isAlive():
-            try:
-                print(f'Child of {self.name}, {self.childs[name]} requested')
-                proxy = current.adapter.addWithUUID(self.childs[name])
-                return IceDrive.DirectoryPrx.uncheckedCast(proxy)
-            except KeyError as e:
-                raise IceDrive.ChildNotExists(name, path=self.getPath())
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                try:
+                    child = self.child(name)
+                    print(f'Child of {self.name}, {child} requested')
+                    return child.proxy(current.adapter)
+                except KeyError as e:
+                    raise IceDrive.ChildNotExists(name, path=self.getPath())
         else:
             raise IceDrive.Unauthorized(self.user)
 
     def createChild(self, name: str, current: Ice.Current = None) -> IceDrive.DirectoryPrx:
         """Create a new child directory and returns its proxy."""
-        if self.userObj.isAlive():
-            if name not in self.childs:  # Check if it already exists
+        if self.liveness.isAlive():
+            with self.mutating():
+                if name in self.childs or name in self.RESERVED:  # Check if it already exists
+                    raise IceDrive.ChildAlreadyExists(name, path=self.getPath())
                 print(f'Request to create directory {name} in {self.name}')
                 child = Directory(name, self.userObj, parent=self)  # Create the child
                 self.childs[name] = child  # Add the child to the dictionary
-                proxy = current.adapter.addWithUUID(child)
-                self.saveToJson()
-                return IceDrive.DirectoryPrx.uncheckedCast(proxy)
-            raise IceDrive.ChildAlreadyExists(name, path=self.getPath())
+                ticket = self.log('mkdir', name)
+            self.durable(ticket)
+            return child.proxy(current.adapter)
         else:
             raise IceDrive.Unauthorized(self.user)  
 
     def removeChild(self, name: str, current: Ice.Current = None) -> None:
         """Remove the child directory with the given name if exists."""
-        if self.userObj.isAlive():
-            if name in self.childs:  # Check if the child exists
+        if self.liveness.isAlive():
+            with self.mutating():
+                if name not in self.childs:  # Check if the child exists
+                    raise IceDrive.ChildNotExists(name, path=self.getPath())
                 print(f'Remove the child {name} from {self.name}')
-                del self.childs[name]  # Delete the child
-                self.saveToJson()
-            else:
-                raise IceDrive.ChildNotExists(name, path=self.getPath())
+                self.dropChild(name)  # Delete the child
+                self.locator.forget(self.uuid, joinPath(self.path, name))  # Its proxies are no longer valid
+                ticket = self.log('rmdir', name)
+            self.durable(ticket)
         else:
             raise IceDrive.Unauthorized(self.user)
 
     def getFiles(self, current: Ice.Current = None) -> List[str]:
         """Return a list of the files linked inside the current directory."""
-        if self.userObj.isAlive():
-            print(f'Request to list files in {self.name}')
-            return list(self.files.keys())
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                print(f'Request to list files in {self.name}')
+                return list(self.files.keys())
         else:
             raise IceDrive.Unauthorized(self.user)
 
     def getBlobId(self, filename: str, current: Ice.Current = None) -> str:
         """Return the "blob id" for a given file name inside the directory."""
-        if self.userObj.isAlive():
-            try:
-                return self.files[filename]
-                print(f'Request to get BlobId of {filename}: {self.files[filename]}')
-            except KeyError as e:
-                raise IceDrive.FileNotFound(filename)
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                try:
+                    return self.files[filename]
+                    print(f'Request to get BlobId of {filename}: {self.files[filename]}')
+                except KeyError as e:
+                    raise IceDrive.FileNotFound(filename)
         else:
             raise IceDrive.Unauthorized(self.user)
 
-    def linkFile(self, filename: str, blob_id: str, current: Ice.Current = None) -> None:
-        """Link a file to a given blob_id."""
-        if self.userObj.isAlive():
-            BlobServicePrx = self.discovery.selectBlob()  # Get a blob service
-            if BlobServicePrx == None:
-                raise IceDrive.TemporaryUnavailable('Blob Service')
-            else:
-                BlobServicePrx.link(blob_id)
-                if filename not in self.files:  # Check if the file exists
-                    print(f'Request to link file {filename} to {self.name}')
-                    self.files[filename] = blob_id  # Create and add the file
-                    self.saveToJson()
-                else:
-                    raise IceDrive.FileAlreadyExists(filename)
+    def linkFile(self, filename: str, blob_id: str, current: Ice.Current = None) -> Ice.Future:
+        """Link a file to a given blob_id (dispatched asynchronously, replies when the blob is linked)."""
+        print(f'Request to link file {filename} to {self.name}')
+        return self.whenAlive(lambda: then(self.linkMany({filename: blob_id}), self.raiseFirst))
+
+    def unlinkFile(self, filename: str, current: Ice.Current = None) -> Ice.Future:
+        """Unlink (remove) a filename from the current directory (dispatched asynchronously)."""
+        print(f'Request to unlink file {filename} from {self.name}')
+        return self.whenAlive(lambda: then(self.unlinkMany([filename]), self.raiseFirst))
+   
+    def createChildren(self, names: List[str], current: Ice.Current = None) -> List[IceDrive.ItemResult]:
+        """Create several child directories, returning one result per name."""
+        if self.liveness.isAlive():
+            with self.mutating():
+                print(f'Request to create {len(names)} directories in {self.name}')
+                results, entries = [], []
+                for name in names:
+                    if name in self.childs or name in self.RESERVED:  # Also a repeated name in the same batch
+                        results.append(IceDrive.ItemResult(name, False, 'ChildAlreadyExists'))
+                        continue
+                    self.childs[name] = Directory(name, self.userObj, parent=self)
+                    entries.append(self.entry('mkdir', name))
+                    results.append(IceDrive.ItemResult(name, True, ''))
+                ticket = self.logMany(entries)
+            self.durable(ticket)
+            return results
         else:
             raise IceDrive.Unauthorized(self.user)
 
-    def unlinkFile(self, filename: str, current: Ice.Current = None) -> None:
-        """Unlink (remove) a filename from the current directory."""
-        if self.userObj.isAlive():
-            BlobServicePrx = self.discovery.selectBlob()  # Get a blob service
-            if BlobServicePrx == None:
-                raise IceDrive.TemporaryUnavailable('Blob Service')
-            else:
-                BlobServicePrx.unlink(self.getBlobId(filename))
-                if filename in self.files:  # Check if it exists
-                    print(f'Request to unlink file {filename} from {self.name}')
-                    del self.files[filename]  # Delete the file
-                    self.saveToJson()
+    def linkFiles(self, files: dict, current: Ice.Current = None) -> Ice.Future:
+        """Link several files (name -> blob_id), returning one result per file (dispatched asynchronously)."""
+        print(f'Request to link {len(files)} files to {self.name}')
+        return self.whenAlive(lambda: then(self.linkMany(files), lambda errors: self.itemResults(files, errors)))
+
+    def unlinkFiles(self, filenames: List[str], current: Ice.Current = None) -> Ice.Future:
+        """Unlink several files, returning one result per file name (dispatched asynchronously)."""
+        print(f'Request to unlink {len(filenames)} files from {self.name}')
+        return self.whenAlive(lambda: then(self.unlinkMany(filenames),
+                                           lambda errors: self.itemResults(filenames, errors)))
+
+    def whenAlive(self, callback) -> Ice.Future:
+        """Return a future of callback(), run once the user is found alive, without blocking on the check"""
+        def checked(alive):
+            if not alive:
+                raise IceDrive.Unauthorized(self.user)
+            return callback()
+        return then(self.liveness.isAliveAsync(), checked)
+
+    def linkMany(self, files: dict) -> Ice.Future:
+        """Add files (name -> blob_id) and link their blobs, returning a future of one exception per file.
+
+        The files are visible right away but only logged once the Blob service
+        confirms the link, so an unlink arriving before that calls the link off
+        instead (see unlinkMany). A failed link removes its file again.
+        """
+        errors, pending = dict.fromkeys(files), {}
+        with self.mutating():
+            self.root.pin()
+            for filename, blob_id in files.items():
+                if filename in self.files:
+                    errors[filename] = IceDrive.FileAlreadyExists(filename)
+                    continue
+                self.files[filename] = blob_id
+                pending[filename] = self.linking[filename] = Ice.Future()
+        # Blob requests are queued without the lock: completing one may run callbacks that take it
+        queued = []
+        try:
+            for filename, future in pending.items():
+                self.blobs.link(files[filename], future)
+                queued.append(filename)
+        except IceDrive.TemporaryUnavailable as e:  # No Blob service left: none of the batch is linked
+            ours = []
+            with self.lock.writing():
+                for filename, future in pending.items():
+                    errors[filename] = e
+                    if self.linking.get(filename) is future:  # Not unlinked meanwhile, that took care of it
+                        del self.linking[filename]
+                        del self.files[filename]
+                        ours.append(filename)
+            for filename in ours:
+                if filename in queued and not self.blobs.cancel(pending[filename]):
+                    self.undoLink(files[filename], pending[filename])
+            for filename, future in pending.items():
+                if filename not in queued:
+                    future.set_exception(e)
+            return self.unpinned(completed(list(errors.values())))
+        return self.unpinned(then(whenAll(pending.values()), lambda _: self.linked(files, pending, errors)))
+
+    def linked(self, files, pending, errors):
+        """Log the links of linkMany() confirmed by the Blob service and remove the failed ones"""
+        entries = []
+        with self.lock.writing():
+            for filename, future in pending.items():
+                if self.linking.get(filename) is not future:  # Unlinked meanwhile, that took care of it
+                    continue
+                del self.linking[filename]
+                errors[filename] = future.exception()
+                if errors[filename] is None:
+                    entries.append(self.entry('link', filename, files[filename]))
+                else:
+                    del self.files[filename]
+            ticket = self.logMany(entries)
+        self.durable(ticket)
+        return list(errors.values())
+
+    def unlinkMany(self, filenames: List[str]) -> Ice.Future:
+        """Remove files and unlink their blobs, returning a future of one exception per name.
+
+        A file whose link is not confirmed yet was never logged: it is removed
+        right away and its link called off (or undone if it was already sent).
+        A file being unlinked already is not found, so only one unlink of it
+        reaches the Blob service.
+        """
+        errors, pending, calledOff = [None] * len(filenames), {}, []
+        with self.mutating():
+            self.root.pin()
+            for i, filename in enumerate(filenames):
+                if filename not in self.files or filename in pending or filename in self.unlinking:
+                    errors[i] = IceDrive.FileNotFound(filename)
+                elif filename in self.linking:
+                    calledOff.append((self.files.pop(filename), self.linking.pop(filename)))
                 else:
+                    pending[filename] = self.files[filename]
+                    self.unlinking.add(filename)
+        # Blob requests are queued without the lock: completing one may run callbacks that take it
+        for blob_id, link in calledOff:
+            if not self.blobs.cancel(link):  # Already sent
+                self.undoLink(blob_id, link)
+        queued, unavailable = {}, None
+        for filename, blob_id in pending.items():
+            try:
+                queued[filename] = self.blobs.unlink(blob_id)
+            except IceDrive.TemporaryUnavailable as e:  # No Blob service left: the rest are not sent
+                unavailable = e
+                break
+
+        def unlinked(_):
+            entries = []
+            with self.lock.writing():
+                for i, filename in enumerate(filenames):
+                    if errors[i] is not None or filename not in pending:
+                        continue
+                    self.unlinking.discard(filename)
+                    if filename not in queued:
+                        errors[i] = unavailable
+                        continue
+                    errors[i] = queued[filename].exception()
+                    if errors[i] is not None:  # The Blob service failed
+                        continue
+                    del self.files[filename]
+                    entries.append(self.entry('unlink', filename))
+                ticket = self.logMany(entries)
+            self.durable(ticket)
+            return errors
+        return self.unpinned(then(whenAll(queued.values()), unlinked))  # No lock is held meanwhile
+
+    @contextmanager
+    def mutating(self):
+        """Lock the tree for writing, raising ObjectNotExistException if it was evicted meanwhile"""
+        with self.lock.writing():
+            if self.root.closed:  # A request dispatched to the old copy, retried it reaches the new one
+                raise Ice.ObjectNotExistException()
+            yield
+
+    def pin(self):
+        """Keep the tree loaded until unpin() (lock must be held, USED ON ROOT DIR ONLY)"""
+        with self.pinLock:
+            self.pins += 1
+
+    def unpin(self):
+        """Let the tree be evicted again (USED ON ROOT DIR ONLY)"""
+        with self.pinLock:
+            self.pins -= 1
+
+    def unpinned(self, future) -> Ice.Future:
+        """Unpin the tree once future is done, returning it"""
+        future.add_done_callback(lambda _: self.root.unpin())
+        return future
+
+    def close(self) -> bool:
+        """Stop every later mutation unless some request is still running, False if so (USED ON ROOT DIR ONLY)"""
+        with self.lock.writing():  # Waits for the mutations in progress
+            with self.pinLock:
+                if self.pins:
+                    return False
+            self.closed = True
+            return True
+
+    def undoLink(self, blob_id, future):
+        """Give back the reference taken by a link that will not be recorded, once it is taken"""
+        def linked(source):
+            if source.exception() is None:  # Nothing to give back if the link failed or was cancelled
+                self.giveBack(blob_id)
+        future.add_done_callback(linked)
+
+    def giveBack(self, blob_id):
+        """Unlink a blob referenced by no file of ours, logging it if there is no Blob service to tell"""
+        try:
+            self.blobs.unlink(blob_id)
+        except IceDrive.TemporaryUnavailable:
+            logging.warning('Could not give back the reference to blob %s: no Blob service', blob_id)
+
+    @staticmethod
+    def raiseFirst(errors):
+        """Raise the exception of a single item batch, if it failed"""
+        if errors[0] is not None:
+            raise errors[0]
+
+    @staticmethod
+    def itemResults(names, errors) -> List[IceDrive.ItemResult]:
+        """One ItemResult per name from the exceptions of a batch (None if it succeeded)"""
+        return [IceDrive.ItemResult(name, error is None, '' if error is None else type(error).__name__)
+                for name, error in zip(names, errors)]
+
+    def getPath(self, current: Ice.Current = None) -> str:
+        """Get the path from root to the current dir"""
+        if self.liveness.isAlive():
+            return self.path  # Computed once when the node is created ("" for the root)
+        else:
+            raise IceDrive.Unauthorized(self.user)
+
+    def resolve(self, path: str, current: Ice.Current = None) -> IceDrive.DirectoryPrx:
+        """Return the proxy to the directory at path, walking it in a single call."""
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                print(f'Request to resolve {path} from {self.name}')
+                return self.walk(path).proxy(current.adapter)
+        else:
+            raise IceDrive.Unauthorized(self.user)
+
+    def resolveFile(self, path: str, current: Ice.Current = None) -> str:
+        """Return the "blob id" of the file at path, walking it in a single call."""
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                print(f'Request to resolve file {path} from {self.name}')
+                directory, separator, filename = path.rpartition('/')
+                node = self.walk(directory or separator)  # "/file" is a file of the root
+                try:
+                    return node.files[filename]
+                except KeyError:
                     raise IceDrive.FileNotFound(filename)
         else:
             raise IceDrive.Unauthorized(self.user)
-   
-    def getPath(self, current: Ice.Current = None) -> str:
-        """Get the path from root to the current dir"""
-        if self.userObj.isAlive():
-            if self.parent:  # Check if it has a parent (is not root)
-                return os.path.join(self.parent.getPath(), self.name)  # Recursive
-            else:
-                return ""
+
+    def getTree(self, maxDepth: int, current: Ice.Current = None) -> IceDrive.DirectoryTree:
+        """Return the whole subtree (up to maxDepth levels, all if negative) in a single call."""
+        if self.liveness.isAlive():
+            with self.lock.reading():
+                print(f'Request to get the tree of {self.name} (max depth {maxDepth})')
+                tree = IceDrive.DirectoryTree(self.path, [])
+                pending = [(self.serialize(maxDepth), self.path, -1, 0)]
+                while pending:  # Flatten the serialized tree in pre-order
+                    data, path, parent, depth = pending.pop()
+                    tree.nodes.append(IceDrive.TreeNode(data['name'], path, parent, depth,
+                                                        list(data['childs']), dict(data['files'])))
+                    if maxDepth < 0 or depth < maxDepth:
+                        index = len(tree.nodes) - 1
+                        for name, child in reversed(list(data['childs'].items())):
+                            pending.append((child, joinPath(path, name), index, depth + 1))
+                return tree
         else:
             raise IceDrive.Unauthorized(self.user)
 
+    def walk(self, path):
+        """Follow path from this directory ("/..." from the root), raising ChildNotExists"""
+        node = self.root if path.startswith('/') else self
+        for name in path.split('/'):
+            if name in ('', '.'):
+                continue
+            if name == '..':
+                node = node.parent if node.parent is not None else node  # The parent of the root is itself
+            elif name in node.childs:
+                node = node.child(name)
+            else:
+                raise IceDrive.ChildNotExists(name, path=node.path)
+        return node
+
+    def proxy(self, adapter) -> IceDrive.DirectoryPrx:
+        """Return the stable proxy of this directory (resolved by the DirectoryLocator)"""
+        identity = self.locator.identity(self.uuid, self.path)
+        return IceDrive.DirectoryPrx.uncheckedCast(adapter.createProxy(identity))
+
+    def child(self, name):
+        """Return a child directory, building it from its serialized form on first access"""
+        child = self.childs[name]
+        if not isinstance(child, Directory):  # Not materialized yet
+            with self.root.materializing:
+                child = self.childs[name]
+                if not isinstance(child, Directory):  # Not built by a concurrent reader meanwhile
+                    stored = child
+                    child = Directory(name, self.userObj, parent=self)
+                    child.files, child.childs = self.storage.materialize(stored)  # Grandchildren stay stored
+                    self.childs[name] = child
+        return child
+
+    def dropChild(self, name):
+        """Remove a child directory, keeping the node count of the tree"""
+        child = self.childs.pop(name)
+        if isinstance(child, Directory):  # Serialized subtrees were never counted
+            self.root.nodes -= child.count()
+
+    def count(self):
+        """Number of materialized directories in this subtree"""
+        return 1 + sum(child.count() for child in self.childs.values() if isinstance(child, Directory))
+
+    def find(self, path):
+        """Walk down from this directory following path, None if some directory does not exist"""
+        node = self
+        for name in splitPath(path):
+            if name not in node.childs:
+                return None
+            node = node.child(name)
+        return node
+
+    def entry(self, op, name, blob_id=None):
+        """Build the storage entry of a mutation of this directory"""
+        entry = {'op': op, 'path': self.path, 'name': name}
+        if blob_id is not None:
+            entry['blobId'] = blob_id
+        return entry
+
+    def log(self, op, name, blob_id=None):
+        """Persist a mutation of this directory in the storage of the user (O(1), lock must be held)"""
+        return self.logMany([self.entry(op, name, blob_id)])
+
+    def logMany(self, entries):
+        """Queue mutations in the storage and the replication stream in tree order (lock must be held).
+
+        Returns the ticket to pass to durable() once the lock is released.
+        """
+        if not entries:
+            return None
+        ticket = self.storage.enqueue(entries, self.root)
+        if self.replicator is not None:
+            self.replicator.record(self.root, entries)  # Sent to the backups in background
+        return ticket
+
+    def durable(self, ticket):
+        """Wait until logged mutations are on disk (lock released, so concurrent writers share a flush)"""
+        self.storage.sync(ticket)
+        if self.storage.needsCompaction():
+            with self.lock.reading():  # The snapshot reads the whole tree
+                if not self.root.closed:  # Written by evict() already
+                    self.storage.compact(self.root, onlyIfNeeded=True)
+
+    def apply(self, entry):
+        """Redo a logged mutation on the tree (USED ON ROOT DIR ONLY)"""
+        node = self.find(entry['path'])
+        if node is None:  # The directory was removed afterwards
+            return
+        name = entry['name']
+        if entry['op'] == 'mkdir':
+            if name not in node.childs:
+                node.childs[name] = Directory(name, node.userObj, parent=node)
+        elif entry['op'] == 'rmdir':
+            if name in node.childs:
+                node.dropChild(name)
+        elif entry['op'] == 'link':
+            node.files[name] = entry['blobId']
+        elif entry['op'] == 'unlink':
+            node.files.pop(name, None)
+
     def saveToJson(self):
-        """Save the entire directory structure to a JSON file."""
-        root = self
-        while root.parent is not None:
-            root = root.parent  # Traverse up to find the root
-
-        data = root.serialize()  # Start serialization from the root
-        json_path = os.path.join(root.dataDir, f"{root.genUUID(root.user)}.json")
-        with open(json_path, 'w', encoding='utf-8') as json_file:
-            json.dump(data, json_file)
-        return json_path
-
-    def serialize(self):
-        """Recursively serialize the directory structure."""
+        """Save the entire directory structure to a JSON snapshot (and truncate the journal)."""
+        return self.storage.compact(self.root)
+
+    def serialize(self, maxDepth=-1):
+        """Recursively serialize the directory structure (only the child names below maxDepth levels)."""
+        if maxDepth == 0:
+            childs = dict.fromkeys(self.childs)
+        else:
+            childs = {name: child.serialize(maxDepth - 1) if isinstance(child, Directory)
+                      else self.storage.subtree(child, maxDepth - 1) for name, child in self.childs.items()}
         data = {
             'name': self.name,
             'user': self.user,
-            'childs': {name: child.serialize() for name, child in self.childs.items()},
-            'files': self.files
+            'childs': childs,
+            'files': {name: blob_id for name, blob_id in self.files.items() if name not in self.linking}
         }
         return data
 
@@ -175,17 +539,8 @@ class Directory(IceDrive.Directory):
             self.name = data['name']  # Name of the root is always root but...
             self.user = data['user']  # The Username (UserObj is already there)
             self.files = data['files']  # Files they have saved
-            self.childs = {name: self.loadChildFromJson(child_data, parent=self) for
-                           name, child_data in data['childs'].items()} # Recursively load other childs
-
-    def loadChildFromJson(self, child_data, parent=None):
-        """Recursively load a child directory from JSON data (USED FOR EVERY OTHER DIR)"""
-        child = Directory(name=child_data['name'], user=parent.userObj, parent=parent)  # Create user 
-        child.user = child_data['user']
-        child.files = child_data['files']
-        child.childs = {name: child.loadChildFromJson(data, parent=child) for
-                        name, data in child_data['childs'].items()}
-        return child
+            self.childs = dict(data['childs'])  # Materialized by child() when first accessed
+            return data.get('seq', 0)  # Last journal entry included in the snapshot
 
     def genUUID(self, user):
         """Generate or resolve a unique user UUID"""
@@ -196,46 +551,292 @@ class Directory(IceDrive.Directory):
 
 class DirectoryService(IceDrive.DirectoryService):
     """Implementation of the IceDrive.Directory interface."""
-    def __init__(self):  # When the server is started, check if the folder exists
+    FORWARDED = 'Directory.Forwarded'  # Context key of a getRoot forwarded by a non-owner instance
+    REPLICA_FACET = 'replica'  # Facet of the DirectoryReplica servant, same identity as the service
+
+    def __init__(self, properties=None):  # When the server is started, check if the folder exists
         self.dataDir = "./USRDIRS/"
         os.makedirs(self.dataDir, exist_ok=True)
+        self.properties = properties
+        self.verified = VerifiedCache(self.config('Directory.Verified.Size', 1000),  # Sessions already verified
+                                      self.config('Directory.Verified.TTL', 60000) / 1000)
+        self.liveness = LivenessCache(self.config('Directory.Liveness.TTL', 5000) / 1000,  # Shared by every tree
+                                      self.config('Directory.Liveness.NegativeTTL', 1000) / 1000,
+                                      onDead=self.verified.invalidate,
+                                      maxUsers=self.config('Directory.Liveness.Size', 1000),
+                                      idleTtl=self.config('Directory.Liveness.IdleTTL', 60000) / 1000)
+        self.locator = DirectoryLocator(self.config('Directory.Evictor.Size', 1000),  # Added to the adapter by the app
+                                        DirectoryLocator.loadSecret(os.path.join(self.dataDir, 'locator.key')))
+        self.storageKind = 'json' if properties is None else properties.getPropertyWithDefault(
+            'Directory.Storage', 'json')  # json (snapshot + journal) or sqlite
+        self.database = None
+        if self.storageKind == 'sqlite':
+            self.database = SqliteDatabase(os.path.join(self.dataDir, 'directories.db'))
+        self.compactEvery = self.config('Directory.Journal.CompactEvery', 1000)
+        self.flushWindow = self.config('Directory.Journal.FlushWindow', 0) / 1000  # Group commit window
+        self.flushBatch = self.config('Directory.Journal.FlushBatch', 64)
+        self.roots = RootCache(self.config('Directory.RootCache.Size', 100),  # Loaded trees, one per user
+                               self.config('Directory.RootCache.MaxNodes', 100000),
+                               onEvict=self.evict)
+        self.blobs = BlobQueue(self.config('Directory.BlobQueue.Window', 10) / 1000,  # Shared link/unlink queue
+                               self.config('Directory.BlobQueue.MaxBatch', 100),
+                               self.config('Directory.BlobQueue.Retries', 2),
+                               self.config('Directory.BlobQueue.HedgePercentile', 95),
+                               self.config('Directory.BlobQueue.HedgeDelay', 50) / 1000)
+        self.loading = threading.Lock()  # Serializes tree loads so a user never gets two trees
+        self.queries = None  # RootQueries to find trees stored by other instances, set by the app
+        self.proxy = None  # Proxy of this instance in the ring, set by the app
+        self.ring = HashRing(self.config('Directory.Ring.VirtualNodes', 100))  # Users assigned to instances
+        self.forwardTimeout = self.config('Directory.Ring.ForwardTimeout', 10000)  # ms, getRoot sent to the owner
+        self.backups = self.config('Directory.Replication.Backups', 1)  # Next instances in the ring
+        self.workers = self.config('Directory.Workers', 1)  # Processes of the supervisor this one belongs to
+        self.worker = self.config('Directory.Worker', -1)  # Index among them, -1 if not a worker
+        self.replicator = None  # Sends the mutations of our trees to their backups, when backups > 0
+        if self.backups > 0:
+            self.replicator = Replicator(self.backupsOf, self.config('Directory.Replication.Window', 50) / 1000,
+                                         self.config('Directory.Replication.MaxBatch', 100))
+        self.replicas = ReplicaStore(os.path.join(self.dataDir, 'replicas'),  # Trees we are a backup of
+                                     self.config('Directory.RootCache.Size', 100))
+        self.authTimeout = self.config('Directory.Auth.Timeout', 5000)  # ms, per call to the Authentication service
+        self.authRetries = self.config('Directory.Auth.Retries', 2)  # Other authenticators tried after a failure
+        Discovery.authenticators.threshold = self.config('Directory.Auth.FailureThreshold', 3)
+        Discovery.authenticators.cooldown = self.config('Directory.Auth.Cooldown', 30000) / 1000
 
-    def getRoot(self, user: IceDrive.UserPrx, current: Ice.Current = None) -> IceDrive.DirectoryPrx:
-        """Return the proxy for the root directory of the given user."""
-        # user = UserPrx
-        # self.user = Username
+    def setQueryTopic(self, publisher, adapter):
+        """Look up the trees this instance does not have by publishing DirectoryQuery on the topic"""
+        self.queries = RootQueries(IceDrive.DirectoryQueryPrx.uncheckedCast(publisher), adapter,
+                                   self.config('Directory.Query.Timeout', 2000) / 1000,
+                                   self.config('Directory.Query.Owners', 10000))
+
+    def config(self, key, default):
+        """Read an integer property (default when running without configuration)"""
+        if self.properties is None:
+            return default
+        return self.properties.getPropertyAsIntWithDefault(key, default)
 
-        self.user = user.getUsername()
-        json_path = os.path.join(self.dataDir, f"{self.genUUID(self.user)}.json")
+    def getRoot(self, user: IceDrive.UserPrx, current: Ice.Current = None) -> Ice.Future:
+        """Return the proxy for the root directory of the given user (dispatched asynchronously)."""
+        # user = UserPrx
+        # username = Username
         print(f'Request to get root of {user}')
-        
-        discovery = Discovery()  # Create the discovery object
-        AuthServicePrx = discovery.selectAuthenticator()  # Get an authenticator
 
-        #TODO: Wait a max of 5 seconds and if no response is given, try a different one and remove
-        #previous one
+        timed = user.ice_invocationTimeout(self.authTimeout)  # A hung Authentication service can't block us
+
+        def verified(username):
+            liveness = self.liveness.get(username, timed)
+            return then(liveness.session(timed).isAliveAsync(),  # Check this session is alive
+                        lambda alive: self.rootProxy(username, timed, liveness, alive, current.adapter,
+                                                     self.FORWARDED in current.ctx))
+
+        username = self.verified.get(timed)
+        if username is not None:  # Session verified already, no call to the Authentication service
+            return verified(username)
 
-        if AuthServicePrx == None:  # Check if it is a valid prx
+        def gotUsername(username):
+            def checked(valid):
+                if not valid:  # The user is not valid
+                    raise IceDrive.Unauthorized(username)
+                self.verified.put(timed, username)
+                return username
+            return then(self.verifyUser(timed, []), checked)
+        return then(then(timed.getUsernameAsync(), gotUsername), verified)  # No dispatch thread waits for them
+
+    def verifyUser(self, user, failed) -> Ice.Future:
+        """Verify a user with a discovered authenticator, failing over to another one if it does not answer"""
+        authenticators = Discovery.authenticators
+        AuthServicePrx = Discovery().selectAuthenticator(exclude=failed)  # Get an authenticator
+        if AuthServicePrx is None:  # None left (or all of them have their circuit open)
             raise IceDrive.TemporaryUnavailable('Authentication Service')
-        else: 
-            if AuthServicePrx.verifyUser: # Check if it is valid
-                if user.isAlive(): # Check the user is alive
-                    if os.path.exists(json_path):  # Root already exists
-                        root = Directory(name="root", user=user)
-                        root.loadFromJson(json_path)
-                    elif False: #TODO: Check if other instances have it
-                        pass
-                    else:  # Root does not exist
-                        root = Directory(name="root", user=user)
-                        root.saveToJson()
-                    proxy = current.adapter.addWithUUID(root)
-                    return IceDrive.DirectoryPrx.uncheckedCast(proxy)
-                else:
-                    raise IceDrive.Unauthorized(self.user)
-            else:  # The user is not valid
-                raise IceDrive.Unauthorized(self.user)
 
-    def genUUID(self, user):
+        def replied(valid):
+            authenticators.balancer.end(AuthServicePrx, started)
+            authenticators.succeeded(AuthServicePrx)
+            return valid
+
+        def failover(error):
+            if not isinstance(error, Ice.LocalException):  # Unauthorized is an answer, not a failure
+                authenticators.balancer.end(AuthServicePrx, started)
+                authenticators.succeeded(AuthServicePrx)
+                raise error
+            authenticators.balancer.end(AuthServicePrx, started, ok=False)
+            authenticators.failed(AuthServicePrx)
+            print(f'Authentication service {AuthServicePrx} failed: {error}')
+            if len(failed) >= self.authRetries:
+                raise IceDrive.TemporaryUnavailable('Authentication Service')
+            return self.verifyUser(user, failed + [AuthServicePrx])  # Try a different one
+
+        started = authenticators.balancer.begin(AuthServicePrx)
+        try:
+            verifying = AuthServicePrx.ice_invocationTimeout(self.authTimeout).verifyUserAsync(user)
+        except Ice.LocalException as e:
+            return failover(e)
+        return recover(then(verifying, replied), failover)
+
+    def rootProxy(self, username, user, liveness, alive, adapter, forwarded=False):
+        """Return the proxy of the root of an authenticated user, wherever the tree is stored"""
+        if not alive:
+            raise IceDrive.Unauthorized(username)
+        uuid = self.genUUID(username)
+        root = self.roots.get(uuid)  # Hot tree shared by every session of the user
+        if root is None:
+            root = self.loadRoot(uuid, username, user, liveness, create=False)
+        if root is not None:
+            return self.localProxy(uuid, username, user, liveness, adapter)
+
+        owner = None if forwarded else self.ownerOf(uuid)  # Forwarded once at most, views may differ
+        if owner is not None:  # The ring assigns the user to other instance
+            print(f'Forwarding the root of {username} to {owner}')
+
+            def ownerFailed(error):
+                if not isinstance(error, Ice.LocalException):
+                    raise error
+                print(f'Owner {owner} failed ({error}), serving the root of {username} here')
+                return self.findRoot(uuid, username, user, liveness, adapter)
+            return recover(owner.getRootAsync(user, {self.FORWARDED: '1'}), ownerFailed)
+        return self.findRoot(uuid, username, user, liveness, adapter)
+
+    def findRoot(self, uuid, username, user, liveness, adapter):
+        """Return the root of a user not stored here: from the instance storing it, or a new tree"""
+        if self.queries is not None:  # Maybe stored in other instance (e.g. before it joined the ring)
+            remote = self.queries.lookup(uuid)
+            if remote is not None:  # Owner known already, no broadcast
+                return remote
+            return then(self.queries.ask(uuid, user),
+                        lambda remote: remote if remote is not None
+                        else self.localProxy(uuid, username, user, liveness, adapter, promote=True))
+        return self.localProxy(uuid, username, user, liveness, adapter, promote=True)
+
+    def ownerOf(self, uuid):
+        """Return the DirectoryService owning a user in the ring, None if it is this instance"""
+        if self.proxy is None:
+            return None
+        self.ring.update(Discovery.directories)
+        owner = self.ring.owner(uuid)
+        if owner is None or owner.ice_getIdentity() == self.proxy.ice_getIdentity():
+            return None
+        return owner.ice_invocationTimeout(self.forwardTimeout)
+
+    def backupsOf(self, uuid):
+        """Return the replica facets of the instances after this one in the ring for a user"""
+        if self.proxy is None:
+            return []
+        self.ring.update(Discovery.directories)
+        others = [prx for prx in self.ring.successors(uuid, self.backups + 1)
+                  if prx.ice_getIdentity() != self.proxy.ice_getIdentity()]
+        return [IceDrive.DirectoryReplicaPrx.uncheckedCast(prx, self.REPLICA_FACET) for prx in others[:self.backups]]
+
+    def localProxy(self, uuid, username, user, liveness, adapter, promote=False) -> IceDrive.DirectoryPrx:
+        """Return the proxy of a root stored in this instance, creating the tree if it is new"""
+        root = self.roots.peek(uuid)  # Looked up by rootProxy() already, this only sees a concurrent load
+        if root is None:
+            root = self.loadRoot(uuid, username, user, liveness, promote=promote)
+        if user is not None:  # The tree may hold an entry dropped from the LivenessCache since
+            root.liveness.session(user)
+        return root.proxy(adapter)
+
+    def storesRoot(self, username) -> bool:
+        """Check if the tree of a user is stored in this instance, without loading it"""
+        uuid = self.genUUID(username)
+        if not self.owns(uuid):  # The data directory is shared with the other workers
+            return False
+        if self.roots.peek(uuid) is not None:
+            return True
+        storage = self.createStorage(uuid, username)
+        try:
+            return storage.exists()
+        finally:
+            storage.close()
+
+    def localRoot(self, username, user):
+        """Return the root of a user if its tree is stored in this instance (used to answer queries).
+
+        user must be verified and alive already: it becomes a session of the
+        tree, whose calls reach this instance directly.
+        """
+        uuid = self.genUUID(username)
+        if not self.owns(uuid):  # The data directory is shared with the other workers
+            return None
+        root = self.roots.get(uuid)
+        if root is None:
+            root = self.loadRoot(uuid, username, user, self.liveness.get(username, user), create=False)
+        elif user is not None:
+            root.liveness.session(user)
+        return root
+
+    def loadRoot(self, uuid, username, user, liveness, create=True, promote=False):
+        """Load (or create) the tree of a user and add it to the RootCache, None if missing and not create.
+
+        With promote, a replica of the tree kept here as a backup becomes the primary copy.
+        """
+        with self.loading:
+            root = self.roots.peek(uuid)
+            if root is not None:  # Loaded by a concurrent getRoot
+                return root
+            storage = self.createStorage(uuid, username)
+            exists = storage.exists()
+            if not exists and promote and self.replicas.has(uuid):  # The primary instance is gone
+                self.replicas.promote(uuid, username, storage)
+                exists = storage.exists()
+            if not exists and not create:
+                storage.close()
+                return None
+            root = Directory(name="root", user=user, liveness=liveness, locator=self.locator, storage=storage,
+                             blobs=self.blobs, username=username, replicator=self.replicator)
+            if exists:  # Root already exists
+                storage.load(root)  # Children are only read when accessed
+            else:  # Root does not exist here nor in other instances
+                storage.create(root)
+            self.locator.register(uuid, root)
+            self.roots.put(uuid, root)
+            if self.queries is not None:
+                self.queries.forget(uuid)
+            return root
+
+    def evict(self, uuid, root) -> bool:
+        """Write back a tree evicted from the RootCache, False if it is busy and must stay loaded"""
+        if not root.close():
+            return False
+        self.locator.unregister(uuid)
+        self.liveness.forget(root.user)
+        if self.replicator is not None:
+            self.replicator.flush()  # Pending mutations of this tree still reach the backups
+            self.replicator.forget(uuid)
+        if root.storage.dirty():  # Mutations are durable already, this just makes the next load cheap
+            root.saveToJson()
+        root.storage.close()
+        return True
+
+    def stats(self) -> dict:
+        """Return the counters of the caches and queues, and the load figures of the backends"""
+        return {'verified': self.verified.stats(), 'liveness': self.liveness.stats(), 'roots': self.roots.stats(),
+                'blobs': self.blobs.stats(), 'backends': Discovery.stats()}
+
+    def shutdown(self):
+        """Write back every loaded tree before the process exits"""
+        logging.info('Directory service stats: %s', self.stats())
+        self.blobs.flush()
+        self.roots.clear()  # evict() also flushes their pending replication
+        self.replicas.trees.clear()
+        if self.database is not None:
+            self.database.close()
+
+    def createStorage(self, uuid, username) -> Storage:
+        """Create the storage of a user tree with the configured backend"""
+        if self.database is not None:
+            return SqliteStorage(self.database, uuid, username)
+        return Journal(self.dataDir, uuid, self.compactEvery, self.flushWindow, self.flushBatch)
+
+    def owns(self, uuid) -> bool:
+        """Check if the trees of a user belong to this process and not to another worker of the supervisor"""
+        return self.worker < 0 or self.workers <= 1 or self.workerOf(uuid, self.workers) == self.worker
+
+    @staticmethod
+    def workerOf(uuid, count) -> int:
+        """Index of the worker of a supervisor with count workers serving a user"""
+        return HashRing.hash(uuid) % count
+
+    @staticmethod
+    def genUUID(user):
         """Generate or resolve a unique user UUID"""
         namespace = UD.UUID("6ba7b810-9dad-11d1-80b4-00c04fd430c8")
         uuid = UD.uuid5(namespace, user)
@@ -1,49 +1,237 @@
 """Servant implementations for service discovery."""
+import logging
 import random
+import threading
+import time
 
 import Ice
 import IceDrive
 
+from icedrive_directory.balancer import Balancer
+
+
+class ServiceRegistry:
+    """Discovered proxies of one kind of service, forgotten when they stop announcing."""
+
+    def __init__(self, ttl=15.0):
+        """Create the registry, entries expire ttl seconds after their last announcement"""
+        self.ttl = ttl
+        self.entries = []  # (identity, proxy), a list for O(1) random selection
+        self.index = {}  # Identity -> position in entries
+        self.seen = {}  # Identity -> time of the last announcement
+        self.version = 0  # Incremented on every membership change
+        self.balancer = Balancer()  # Latency and in-flight calls of each proxy
+        self.threshold = 3  # Consecutive failures that open the circuit of a proxy
+        self.cooldown = 30.0  # Seconds an open circuit keeps the proxy out of selection
+        self.failures = {}  # Identity -> consecutive failures
+        self.openUntil = {}  # Identity -> time the proxy becomes selectable again
+        self.lock = threading.Lock()
+
+    def announce(self, prx) -> bool:
+        """Record an announcement, returning True if the proxy was not known"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            self.seen[identity] = time.monotonic()
+            if identity in self.index:
+                return False
+            self.index[identity] = len(self.entries)
+            self.entries.append((identity, prx))
+            self.version += 1
+            return True
+
+    def remove(self, prx):
+        """Forget a proxy (O(1), the last entry takes its place)"""
+        with self.lock:
+            self.removeLocked(prx.ice_getIdentity())
+
+    def removeLocked(self, identity):
+        """Forget an identity (lock must be held)"""
+        position = self.index.pop(identity, None)
+        if position is None:
+            return
+        del self.seen[identity]
+        self.version += 1
+        self.failures.pop(identity, None)
+        self.openUntil.pop(identity, None)
+        self.balancer.forget(identity)
+        last = self.entries.pop()
+        if position < len(self.entries):
+            self.entries[position] = last
+            self.index[last[0]] = position
+
+    def select(self, exclude=()):
+        """Return the least loaded of two random live proxies, None if there is none"""
+        exclude = {prx.ice_getIdentity() for prx in exclude}
+        with self.lock:
+            now = time.monotonic()
+            exclude.update(identity for identity, until in self.openUntil.items() if until > now)
+            first = self.pick(exclude, now)
+            second = self.pick(exclude, now) if len(self.entries) > 1 else None
+        return self.balancer.choose(first, second)
+
+    def pick(self, exclude, now):
+        """Return a random live proxy other than the excluded ones (lock must be held)"""
+        attempts = 0
+        while self.entries:
+            identity, prx = random.choice(self.entries)
+            if now - self.seen[identity] > self.ttl:  # Stopped announcing, probably crashed
+                print(f'Service expired: {prx}')
+                self.removeLocked(identity)
+                continue
+            if identity not in exclude:
+                return prx
+            attempts += 1
+            if attempts > len(exclude):  # Mostly excluded proxies, look at all of them
+                return next((prx for identity, prx in self.entries
+                             if identity not in exclude and now - self.seen[identity] <= self.ttl), None)
+        return None
+
+    def succeeded(self, prx):
+        """Record a successful call, closing the circuit of the proxy"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            self.failures.pop(identity, None)
+            self.openUntil.pop(identity, None)
+
+    def failed(self, prx):
+        """Record a failed call, opening the circuit of the proxy after threshold failures in a row"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            if identity not in self.index:
+                return
+            failures = self.failures[identity] = self.failures.get(identity, 0) + 1
+            if failures >= self.threshold:  # Half open after the cooldown: one more failure reopens it
+                self.openUntil[identity] = time.monotonic() + self.cooldown
+                print(f'Service circuit opened for {self.cooldown}s: {prx}')
+
+    def alive(self, prx) -> bool:
+        """Check if a proxy is known and still announcing itself"""
+        identity = prx.ice_getIdentity()
+        with self.lock:
+            return identity in self.index and time.monotonic() - self.seen[identity] <= self.ttl
+
+    def expire(self):
+        """Forget every proxy that stopped announcing"""
+        with self.lock:
+            now = time.monotonic()
+            for identity in [identity for identity, seen in self.seen.items() if now - seen > self.ttl]:
+                self.removeLocked(identity)
+
+    def proxies(self) -> list:
+        """Return the live proxies"""
+        with self.lock:
+            now = time.monotonic()
+            return [prx for identity, prx in self.entries if now - self.seen[identity] <= self.ttl]
+
+    def __len__(self):
+        """Number of known proxies"""
+        return len(self.entries)
+
 
 class Discovery(IceDrive.Discovery):
     """Servants class for service discovery."""
 
-    # Global dictionaries so any object can access them
-    authenticators = {}  # Discovered authentication services
-    directories = {}  # Discovered directory services
-    blobs = {}  # Discovered blob services
+    # Global registries so any object can access them
+    authenticators = ServiceRegistry()  # Discovered authentication services
+    directories = ServiceRegistry()  # Discovered directory services
+    blobs = ServiceRegistry()  # Discovered blob services
+
+    @staticmethod
+    def setTimeToLive(ttl):
+        """Set how long (seconds) a service stays selectable after its last announcement"""
+        for registry in (Discovery.authenticators, Discovery.directories, Discovery.blobs):
+            registry.ttl = ttl
+
+    @staticmethod
+    def stats() -> dict:
+        """Return the load figures of every discovered service, to see why one is being avoided"""
+        return {'authenticators': Discovery.authenticators.balancer.stats(),
+                'blobs': Discovery.blobs.balancer.stats()}
 
     def announceAuthentication(self, prx: IceDrive.AuthenticationPrx, current: Ice.Current = None) -> None:
-        """Receive an Authentication service announcement.""" 
-        identity = prx.ice_getIdentity()
-        if not(identity in Discovery.authenticators):
+        """Receive an Authentication service announcement."""
+        if Discovery.authenticators.announce(prx):
             print(f'Authenticator service found: {prx}')
-            Discovery.authenticators[identity] = prx
 
     def announceDirectoryService(self, prx: IceDrive.DirectoryServicePrx, current: Ice.Current = None) -> None:
         """Receive an Directory service announcement."""
-        identity = prx.ice_getIdentity()
-        if not(identity in Discovery.directories):
+        if Discovery.directories.announce(prx):
             print(f'Directory service found: {prx}')
-            Discovery.directories[identity] = prx       
 
     def announceBlobService(self, prx: IceDrive.BlobServicePrx, current: Ice.Current = None) -> None:
         """Receive an Blob service announcement."""
-        identity = prx.ice_getIdentity()
-        if not(identity in Discovery.blobs):
+        if Discovery.blobs.announce(prx):
             print(f'Blob service found: {prx}')
-            Discovery.blobs[identity] = prx
-
-    def selectAuthenticator(self):
-        """Select a random Authenticator Service"""
-        if not Discovery.authenticators:
-            return None  # Return none so DirectoryService can throw the exception
-        else:
-            return Discovery.authenticators[random.choice(list(Discovery.authenticators.keys()))]
-
-    def selectBlob(self):
-        """Select a random Blob Service"""
-        if not Discovery.blobs:
-            return None  # Return none so Directory can throw the exception
-        else:
-            return Discovery.blobs[random.choice(list(Discovery.blobs.keys()))]
+
+    def selectAuthenticator(self, exclude=()):
+        """Select a lightly loaded Authenticator Service (None so DirectoryService can throw the exception)"""
+        return Discovery.authenticators.select(exclude)
+
+    def selectBlob(self, exclude=()):
+        """Select a lightly loaded Blob Service (None so Directory can throw the exception)"""
+        return Discovery.blobs.select(exclude)
+
+
+class Announcer:
+    """Background announcement of a service, less frequent as the ring of directory services grows.
+
+    Once started, each instance announces every interval seconds times the
+    number of directory services known (at most maxInterval), so every
+    instance keeps receiving about one announcement per interval whatever the
+    size of the ring. The first announcements go out every minInterval
+    seconds, doubling up to that period; a join or leave afterwards gets a
+    single prompt announcement so the newcomer learns about us. Each wait is
+    jittered so the instances do not announce in lockstep. With expiryFactor,
+    directory services expire after that many periods without announcing.
+    """
+
+    JITTER = 0.2  # Fraction of the interval added or removed at random
+
+    def __init__(self, announce, minInterval=0.5, interval=5.0, maxInterval=60.0, expiryFactor=None):
+        """Create the announcer, announce() publishes one announcement"""
+        self.announce = announce
+        self.minInterval = minInterval
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.expiryFactor = expiryFactor
+        self.wait = minInterval  # Seconds until the next announcement (before the jitter)
+        self.starting = True  # Still doubling the wait up to the period
+        self.version = None  # Membership seen at the last announcement
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='Announcer', daemon=True)
+
+    def start(self):
+        """Start announcing in background"""
+        self.thread.start()
+
+    def run(self):
+        """Announce until stopped"""
+        while True:
+            try:
+                self.announce()
+            except Ice.LocalException as e:  # IceStorm unreachable, keep trying
+                logging.warning('Announcement failed: %s', e)
+            period = self.period()
+            if self.expiryFactor is not None:  # The others announce with the same period
+                Discovery.directories.ttl = period * (1 + self.JITTER) * self.expiryFactor
+            version = Discovery.directories.version
+            if version != self.version:  # Someone joined or left: let them know us soon
+                self.version = version
+                self.wait = self.minInterval
+            elif self.starting:
+                self.wait = min(self.wait * 2, period)
+                self.starting = self.wait < period
+            else:
+                self.wait = period
+            if self.stopped.wait(self.wait * random.uniform(1 - self.JITTER, 1 + self.JITTER)):
+                return
+
+    def period(self) -> float:
+        """Seconds between announcements while the membership does not change"""
+        return min(self.maxInterval, self.interval * max(1, len(Discovery.directories)))
+
+    def stop(self):
+        """Stop announcing and wait for the thread"""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,89 @@
+"""Helpers to chain Ice futures for asynchronous dispatch (AMD) and invocation (AMI)."""
+
+import threading
+
+import Ice
+
+
+def completed(value) -> Ice.Future:
+    """Return a future that already holds value"""
+    future = Ice.Future()
+    future.set_result(value)
+    return future
+
+
+def forward(source: Ice.Future, target: Ice.Future):
+    """Complete target with the outcome of source (which must be done)"""
+    try:
+        target.set_result(source.result())
+    except Exception as e:
+        target.set_exception(e)
+
+
+def whenAll(futures) -> Ice.Future:
+    """Return a future completed with the list of futures once every one is done (it never fails)"""
+    futures = list(futures)
+    result = Ice.Future()
+    if not futures:
+        result.set_result(futures)
+        return result
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            result.set_result(futures)
+
+    for future in futures:
+        future.add_done_callback(done)
+    return result
+
+
+def then(future: Ice.Future, callback) -> Ice.Future:
+    """Return a future completed with callback(result), or with the first exception raised.
+
+    If callback returns another future, the returned future completes when it does.
+    """
+    result = Ice.Future()
+
+    def done(source):
+        try:
+            value = callback(source.result())
+        except Exception as e:
+            result.set_exception(e)
+            return
+        if isinstance(value, Ice.Future):
+            value.add_done_callback(lambda chained: forward(chained, result))
+        else:
+            result.set_result(value)
+
+    future.add_done_callback(done)
+    return result
+
+
+def recover(future: Ice.Future, callback) -> Ice.Future:
+    """Return a future completed with the result of future, or with callback(exception) if it failed.
+
+    As with then(), callback may return another future (e.g. a retry) or raise.
+    """
+    result = Ice.Future()
+
+    def done(source):
+        try:
+            value = source.result()
+        except Exception as e:
+            try:
+                value = callback(e)
+            except Exception as error:
+                result.set_exception(error)
+                return
+        if isinstance(value, Ice.Future):
+            value.add_done_callback(lambda chained: forward(chained, result))
+        else:
+            result.set_result(value)
+
+    future.add_done_callback(done)
+    return result
@@ -0,0 +1,201 @@
+"""Append-only persistence of the directory trees."""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from icedrive_directory.storage import Storage
+
+
+class Journal(Storage):
+    """Operation log of one user tree, compacted periodically into a JSON snapshot.
+
+    Every mutation is appended as one JSON line to USRDIRS/<uuid>.log, and
+    USRDIRS/<uuid>.json holds the whole tree as of sequence number "seq".
+    Recovery loads the snapshot and replays the log entries that come after it.
+
+    This backend is not lazy: load() parses the whole snapshot, and the
+    children not accessed yet stay in memory as parsed JSON. Only building
+    their Directory servants is deferred, so memory follows the size of the
+    tree. SqliteStorage reads each directory when it is first accessed.
+
+    Appends use group commit: enqueue() numbers and buffers the entries while
+    the tree is locked, and sync() waits for them once it is released. The
+    first waiting caller becomes the leader, gathers the entries queued during
+    flushWindow seconds (or until flushBatch entries) and makes all of them
+    durable with a single write and fsync. Every caller returns only once its
+    own entry is on disk.
+    """
+
+    def __init__(self, dataDir, uuid, compactEvery=1000, flushWindow=0.0, flushBatch=64):
+        """Create the journal of the user with the given UUID"""
+        self.snapshotPath = os.path.join(dataDir, f"{uuid}.json")
+        self.logPath = os.path.join(dataDir, f"{uuid}.log")
+        self.compactEvery = compactEvery  # Log entries before writing a new snapshot
+        self.flushWindow = flushWindow  # Seconds a leader waits for more entries
+        self.flushBatch = flushBatch  # Entries that trigger a flush without waiting
+        self.seq = 0  # Sequence number of the last mutation
+        self.durable = 0  # Sequence number of the last mutation on disk
+        self.pending = 0  # Entries in the log not covered by the snapshot
+        self.buffer = []  # Serialized entries waiting for the next flush
+        self.flushing = False  # Some thread is writing to disk
+        self.logFile = None
+        self.closed = False
+        self.lock = threading.RLock()
+        self.flushed = threading.Condition(self.lock)
+
+    def exists(self) -> bool:
+        """Check if there is anything stored for this user"""
+        return os.path.exists(self.snapshotPath) or os.path.exists(self.logPath)
+
+    def appendMany(self, entries, root):
+        """Add several mutations to the log, made durable together by a single flush"""
+        self.sync(self.enqueue(entries, root))
+        return entries
+
+    def enqueue(self, entries, root):
+        """Number and buffer mutations, returning the sequence number to sync() on"""
+        with self.lock:
+            if self.closed:  # Another Journal may own the files now
+                raise ValueError(f'{self.logPath} is closed')
+            for entry in entries:
+                self.seq += 1
+                entry['seq'] = self.seq
+                self.buffer.append(json.dumps(entry) + '\n')
+            self.flushed.notify_all()  # A leader waiting for the batch to fill up
+            return self.seq
+
+    def sync(self, ticket):
+        """Block until the mutations up to sequence number ticket are on disk"""
+        if ticket is not None:
+            with self.lock:
+                self.waitDurable(ticket)
+
+    def needsCompaction(self) -> bool:
+        """Check if the log has grown enough to be folded into a new snapshot"""
+        return self.pending >= self.compactEvery
+
+    def dirty(self) -> bool:
+        """Check if the log has entries not folded into the snapshot yet"""
+        with self.lock:
+            return self.pending > 0 or bool(self.buffer)
+
+    def waitDurable(self, seq):
+        """Block until seq is on disk, flushing a batch if nobody else is (lock must be held)"""
+        while self.durable < seq:
+            if self.flushing:
+                self.flushed.wait()
+                continue
+
+            self.flushing = True  # This thread is the leader of the next group
+            try:
+                deadline = time.monotonic() + self.flushWindow
+                while len(self.buffer) < self.flushBatch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.flushed.wait(remaining)
+                batch, self.buffer = self.buffer, []
+                last = self.seq
+                try:
+                    self.lock.release()  # Let other callers queue entries during the write
+                    try:
+                        self.writeLog(batch)
+                    finally:
+                        self.lock.acquire()
+                    self.pending += len(batch)
+                except Exception:
+                    self.buffer = batch + self.buffer  # Retried by the next leader
+                    raise
+                self.durable = max(self.durable, last)
+            finally:
+                self.flushing = False
+                self.flushed.notify_all()
+
+    def writeLog(self, batch):
+        """Append a group of entries with a single write and fsync"""
+        if self.logFile is None:
+            self.logFile = open(self.logPath, 'a', encoding='utf-8')
+        self.logFile.write(''.join(batch))
+        self.logFile.flush()
+        os.fsync(self.logFile.fileno())
+
+    def compact(self, root, onlyIfNeeded=False):
+        """Write a snapshot of the whole tree and truncate the log (tree locked, so every entry is applied)"""
+        with self.lock:
+            while self.flushing:  # Never truncate the log under a running flush
+                self.flushed.wait()
+            if self.closed or (onlyIfNeeded and not self.needsCompaction()):  # Done by a concurrent caller
+                return self.snapshotPath
+            self.buffer = []  # Already applied to the tree, so the snapshot covers them
+            self.writeSnapshot(root)
+            self.durable = self.seq
+            self.flushed.notify_all()
+        return self.snapshotPath
+
+    def writeSnapshot(self, root):
+        """Save the tree with temp file, fsync and rename, then truncate the log (lock must be held)"""
+        data = root.serialize()
+        data['seq'] = self.seq
+        tmp_path = self.snapshotPath + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as json_file:
+            json.dump(data, json_file)
+            json_file.flush()
+            os.fsync(json_file.fileno())
+        os.replace(tmp_path, self.snapshotPath)  # Atomic, the old snapshot is valid until here
+
+        if self.logFile is not None:
+            self.logFile.close()
+        self.logFile = open(self.logPath, 'w', encoding='utf-8')  # Everything is in the snapshot
+        self.pending = 0
+
+    def create(self, root):
+        """Write the first snapshot of a new user"""
+        return self.compact(root)
+
+    def materialize(self, stored):
+        """Return (files, childs) of a child directory read from the snapshot"""
+        return stored['files'], dict(stored['childs'])  # Grandchildren stay serialized
+
+    def subtree(self, stored, maxDepth=-1) -> dict:
+        """A child directory read from the snapshot is already serialized (deeper levels are ignored by getTree)"""
+        return stored
+
+    def load(self, root):
+        """Load the snapshot (if any) into root and apply the logged mutations after it"""
+        with self.lock:
+            if os.path.exists(self.snapshotPath):
+                self.seq = root.loadFromJson(self.snapshotPath)
+            if not os.path.exists(self.logPath):
+                return
+            torn = False
+            with open(self.logPath, 'r', encoding='utf-8') as log_file:
+                for line in log_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # Torn write of the last entry before a crash
+                        logging.warning('Ignoring corrupted journal entry in %s', self.logPath)
+                        torn = True
+                        break
+                    if entry['seq'] <= self.seq:  # Already in the snapshot
+                        continue
+                    root.apply(entry)
+                    self.seq = entry['seq']
+                    self.pending += 1
+            if self.pending or torn:  # Start from a clean log
+                self.compact(root)
+            self.durable = self.seq
+
+    def close(self):
+        """Flush the buffered entries and close the log file, no entry can be added afterwards"""
+        with self.lock:
+            if self.buffer:
+                self.waitDurable(self.seq)
+            while self.flushing:
+                self.flushed.wait()
+            self.closed = True
+            if self.logFile is not None:
+                self.logFile.close()
+                self.logFile = None
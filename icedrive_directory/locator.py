@@ -0,0 +1,116 @@
+"""Servant locator for the Directory nodes of the loaded user trees."""
+
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+
+import Ice
+
+
+class DirectoryLocator(Ice.ServantLocator):
+    """Resolve "<token>/<path>" identities to Directory servants, with an LRU evictor.
+
+    The token is an HMAC of the user UUID with a key only this service knows,
+    so identities stay the same across loads and restarts but can't be built
+    from a username.
+    """
+
+    CATEGORY = "directory"
+
+    def __init__(self, size=1000, secret=None):
+        """Create the locator keeping at most size resolved servants (random key if secret is None)"""
+        self.size = size
+        self.secret = secret if secret is not None else os.urandom(32)
+        self.roots = {}  # Token -> root Directory
+        self.evictor = OrderedDict()  # Identity name -> Directory, least recently used first
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def loadSecret(path) -> bytes:
+        """Read the key of the identities, creating a random one the first time"""
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as key_file:
+                key_file.write(os.urandom(32))
+                key_file.flush()
+                os.fsync(key_file.fileno())
+            os.chmod(tmp_path, 0o600)
+            try:
+                os.link(tmp_path, path)  # Atomic, other processes sharing the directory keep the first key
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(path, 'rb') as key_file:
+            return key_file.read()
+
+    def token(self, uuid) -> str:
+        """Return the unguessable name of the tree of a user"""
+        return hmac.new(self.secret, uuid.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def identity(self, uuid, path) -> Ice.Identity:
+        """Build the stable identity of the directory at path in the tree of a user"""
+        return Ice.Identity(name=f"{self.token(uuid)}/{path}", category=self.CATEGORY)
+
+    def register(self, uuid, root):
+        """Make a user tree reachable, dropping servants resolved from a previous tree"""
+        token = self.token(uuid)
+        with self.lock:
+            if self.roots.get(token) is not root:
+                self.roots[token] = root
+                self.forgetLocked(token, "")
+
+    def unregister(self, uuid):
+        """Make a user tree unreachable (its proxies raise ObjectNotExistException until getRoot)"""
+        token = self.token(uuid)
+        with self.lock:
+            self.roots.pop(token, None)
+            self.forgetLocked(token, "")
+
+    def forget(self, uuid, path):
+        """Drop the resolved servants of a removed directory and its descendants"""
+        token = self.token(uuid)
+        with self.lock:
+            self.forgetLocked(token, path)
+
+    def forgetLocked(self, token, path):
+        """Drop the resolved servants of path and everything below it (lock must be held)"""
+        target = f"{token}/{path}"
+        prefix = target if not path else f"{target}/"
+        for name in [name for name in self.evictor if name == target or name.startswith(prefix)]:
+            del self.evictor[name]
+
+    def locate(self, current: Ice.Current):
+        """Return the servant for the requested identity, or None if it does not exist"""
+        name = current.id.name
+        with self.lock:
+            servant = self.evictor.get(name)
+            if servant is not None:
+                self.evictor.move_to_end(name)
+                return servant, None
+            token, _, path = name.partition('/')
+            root = self.roots.get(token)
+
+        if root is None:  # Not loaded, the client must call getRoot again
+            return None
+        with root.lock.reading():
+            servant = root.find(path)
+        if servant is None:
+            return None
+
+        with self.lock:
+            self.evictor[name] = servant
+            while len(self.evictor) > self.size:
+                self.evictor.popitem(last=False)  # Evict the least recently used
+        return servant, None
+
+    def finished(self, current: Ice.Current, servant, cookie):
+        """Nothing to release, servants live in their trees"""
+
+    def deactivate(self, category: str):
+        """Forget every tree when the adapter is deactivated"""
+        with self.lock:
+            self.roots.clear()
+            self.evictor.clear()
@@ -0,0 +1,273 @@
+"""Primary/backup replication of the user trees between Directory service instances."""
+
+import json
+import logging
+import os
+import threading
+import uuid as UD
+
+import Ice
+import IceDrive
+
+from icedrive_directory.cache import RootCache
+from icedrive_directory.journal import Journal
+from icedrive_directory.storage import joinPath
+
+
+class Stream:
+    """Mutations of one tree waiting to be sent to its backups."""
+
+    def __init__(self, root):
+        """Start a new stream, backups will need the whole tree first"""
+        self.root = root
+        self.epoch = UD.uuid4().hex  # Sequence numbers are only comparable inside one epoch
+        self.seq = 0  # Last sequence number assigned
+        self.queue = []  # Mutations not sent yet
+
+
+class Replicator:
+    """Sends the mutations of the trees loaded here to their backup instances.
+
+    Mutations are numbered per tree and queued for up to window seconds (or
+    maxBatch mutations), then sent asynchronously in one replicate() call to
+    each backup. A backup that misses a batch, or has never seen this epoch
+    of the tree (e.g. the tree was loaded again), answers -1 and receives
+    the whole tree with install(). After that it only gets the mutations, so
+    at most window seconds of changes are lost if the primary fails.
+    """
+
+    def __init__(self, backupsOf, window=0.05, maxBatch=100):
+        """Create the replicator, backupsOf(uuid) returns the DirectoryReplicaPrx of the backups"""
+        self.backupsOf = backupsOf
+        self.window = window
+        self.maxBatch = maxBatch
+        self.streams = {}  # User UUID -> Stream
+        self.size = 0
+        self.timer = None
+        self.counters = {'mutations': 0, 'batches': 0, 'installs': 0, 'failures': 0}
+        self.lock = threading.Lock()
+
+    def record(self, root, entries):
+        """Queue mutations of the primary tree, in order (called with the tree locked, so it never sends)"""
+        with self.lock:
+            stream = self.streams.get(root.uuid)
+            if stream is None:
+                stream = self.streams[root.uuid] = Stream(root)
+            for entry in entries:
+                stream.seq += 1
+                stream.queue.append(IceDrive.Mutation(stream.seq, entry['op'], entry['path'], entry['name'],
+                                                      entry.get('blobId', '')))
+            self.size += len(entries)
+            self.counters['mutations'] += len(entries)
+            if self.size >= self.maxBatch and (self.timer is None or self.timer.interval > 0):
+                if self.timer is not None:
+                    self.timer.cancel()
+                self.timer = threading.Timer(0, self.flush)  # Full batch, sent now from the timer thread
+                self.timer.daemon = True
+                self.timer.start()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Send the queued mutations of every tree to its backups"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            batches = [(uuid, stream, stream.queue) for uuid, stream in self.streams.items() if stream.queue]
+            for _, stream, _ in batches:
+                stream.queue = []
+            self.size = 0
+        for uuid, stream, batch in batches:
+            for backup in self.backupsOf(uuid):
+                self.send(backup, uuid, stream, batch)
+
+    def send(self, backup, uuid, stream, batch):
+        """Send one batch to one backup, installing the whole tree if the backup is not in sync"""
+        with self.lock:
+            self.counters['batches'] += 1
+
+        def done(result):
+            try:
+                applied = result.result()
+            except Ice.Exception as e:
+                self.failed(backup, e)
+                return
+            if applied < batch[-1].seq:  # Missed some batch or a different epoch
+                self.install(backup, uuid, stream)
+        try:
+            backup.replicateAsync(uuid, stream.root.user, stream.epoch, batch[0].seq, batch).add_done_callback(done)
+        except Ice.LocalException as e:
+            self.failed(backup, e)
+
+    def install(self, backup, uuid, stream):
+        """Send the whole tree to a backup"""
+        with self.lock:
+            self.counters['installs'] += 1
+            seq = stream.seq  # Taken before serializing: replaying later mutations is idempotent
+        with stream.root.lock.reading():
+            tree = json.dumps(stream.root.serialize())
+
+        def done(result):
+            try:
+                result.result()
+            except Ice.Exception as e:
+                self.failed(backup, e)
+        try:
+            backup.installAsync(uuid, stream.root.user, stream.epoch, seq, tree).add_done_callback(done)
+        except Ice.LocalException as e:
+            self.failed(backup, e)
+
+    def failed(self, backup, error):
+        """Count a failed call, the backup catches up with install() on the next batch"""
+        logging.warning('Replication to %s failed: %s', backup, error)
+        with self.lock:
+            self.counters['failures'] += 1
+
+    def forget(self, uuid):
+        """Stop replicating a tree that is no longer loaded here"""
+        with self.lock:
+            self.streams.pop(uuid, None)
+
+    def stats(self) -> dict:
+        """Return a copy of the counters"""
+        with self.lock:
+            return dict(self.counters, streams=len(self.streams), queued=self.size)
+
+
+class ReplicaStore:
+    """Backup copies of the trees of other instances, kept in USRDIRS/replicas/ as journals."""
+
+    def __init__(self, dataDir, maxTrees=100):
+        """Create the store"""
+        self.dataDir = dataDir
+        os.makedirs(dataDir, exist_ok=True)
+        self.trees = RootCache(maxTrees, onEvict=self.evict)  # Replica trees being updated
+        self.epochs = {}  # User UUID -> epoch of the primary stream
+        self.lock = threading.Lock()  # Replicas are updated one batch at a time
+
+    def epochPath(self, uuid):
+        """Path of the file with the epoch of a replica"""
+        return os.path.join(self.dataDir, f"{uuid}.epoch")
+
+    def has(self, uuid) -> bool:
+        """Check if there is a replica of a tree"""
+        return os.path.exists(self.epochPath(uuid))
+
+    def open(self, uuid, username):
+        """Return the loaded replica tree of a user, None if there is no replica"""
+        root = self.trees.get(uuid)
+        if root is not None or not self.has(uuid):
+            return root
+        from icedrive_directory.directory import Directory  # Directory uses this module too
+        storage = Journal(self.dataDir, uuid)
+        root = Directory(name="root", user=None, storage=storage, username=username)
+        storage.load(root)
+        with open(self.epochPath(uuid), 'r', encoding='utf-8') as epoch_file:
+            self.epochs[uuid] = epoch_file.read().strip()
+        self.trees.put(uuid, root)
+        return root
+
+    def replicate(self, uuid, username, epoch, firstSeq, mutations) -> int:
+        """Apply a batch of mutations, returning the last sequence number applied (-1 if out of sync)"""
+        with self.lock:
+            root = self.open(uuid, username)
+            if root is None or self.epochs.get(uuid) != epoch:
+                return -1
+            last = root.storage.seq
+            if firstSeq > last + 1:  # Some batch was lost
+                return -1
+            entries = []
+            for mutation in mutations:
+                if mutation.seq <= last:  # Already applied (resent batch)
+                    continue
+                entry = {'op': mutation.op, 'path': mutation.path, 'name': mutation.name}
+                if mutation.op == 'link':
+                    entry['blobId'] = mutation.blobId
+                root.apply(entry)
+                entries.append(entry)
+            if entries:
+                root.storage.appendMany(entries, root)  # Numbered from last + 1, like the primary
+                if root.storage.needsCompaction():
+                    root.saveToJson()
+            return root.storage.seq
+
+    def install(self, uuid, username, epoch, seq, tree):
+        """Replace the replica of a tree with a whole copy as of sequence number seq"""
+        with self.lock:
+            self.close(uuid)
+            data = json.loads(tree)
+            data['seq'] = seq
+            snapshot_path = os.path.join(self.dataDir, f"{uuid}.json")
+            tmp_path = snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as json_file:
+                json.dump(data, json_file)
+                json_file.flush()
+                os.fsync(json_file.fileno())
+            os.replace(tmp_path, snapshot_path)
+            log_path = os.path.join(self.dataDir, f"{uuid}.log")
+            if os.path.exists(log_path):
+                os.remove(log_path)  # Everything is in the new snapshot
+            with open(self.epochPath(uuid), 'w', encoding='utf-8') as epoch_file:
+                epoch_file.write(epoch)
+
+    def promote(self, uuid, username, storage):
+        """Turn the replica of a tree into the primary copy stored in storage"""
+        with self.lock:
+            root = self.open(uuid, username)
+            if root is None:
+                return
+            root.saveToJson()  # Snapshot and empty log
+            self.close(uuid)
+            if isinstance(storage, Journal):  # Same format, just move the files
+                os.replace(root.storage.snapshotPath, storage.snapshotPath)
+                os.replace(root.storage.logPath, storage.logPath)
+            else:
+                storage.create(root)
+                for entries in treeBatches(root.serialize()):  # A directory must exist before its children
+                    storage.appendMany(entries, root)
+                os.remove(root.storage.snapshotPath)
+                os.remove(root.storage.logPath)
+            os.remove(self.epochPath(uuid))
+            print(f'Replica of {username} promoted to primary')
+
+    def close(self, uuid):
+        """Unload a replica tree (lock must be held)"""
+        root = self.trees.remove(uuid)
+        if root is not None:
+            root.storage.close()
+        self.epochs.pop(uuid, None)
+
+    def evict(self, uuid, root):
+        """Unload a replica tree evicted from the cache"""
+        if root.storage.dirty():
+            root.saveToJson()
+        root.storage.close()
+        self.epochs.pop(uuid, None)
+
+
+def treeBatches(data, path=""):
+    """Yield, one directory at a time and parents first, the mkdir/link entries that rebuild a serialized tree"""
+    yield [{'op': 'link', 'path': path, 'name': name, 'blobId': blob_id} for name, blob_id in data['files'].items()] + \
+        [{'op': 'mkdir', 'path': path, 'name': name} for name in data['childs']]
+    for name, child in data['childs'].items():
+        yield from treeBatches(child, joinPath(path, name))
+
+
+class DirectoryReplica(IceDrive.DirectoryReplica):
+    """Servant receiving the mutations of the trees this instance is a backup of."""
+
+    def __init__(self, store: ReplicaStore):
+        """Create the servant"""
+        self.store = store
+
+    def replicate(self, uuid: str, username: str, epoch: str, firstSeq: int, mutations, current: Ice.Current = None) -> int:
+        """Apply a batch of mutations of a tree."""
+        return self.store.replicate(uuid, username, epoch, firstSeq, mutations)
+
+    def install(self, uuid: str, username: str, epoch: str, seq: int, tree: str, current: Ice.Current = None) -> None:
+        """Receive the whole tree of a user."""
+        print(f'Installing replica of {username} at sequence {seq}')
+        self.store.install(uuid, username, epoch, seq, tree)
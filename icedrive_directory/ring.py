@@ -0,0 +1,65 @@
+"""Consistent-hash assignment of users to Directory service instances."""
+
+import bisect
+import hashlib
+import threading
+
+import Ice
+
+
+class HashRing:
+    """Consistent-hash ring of the announced DirectoryService instances.
+
+    Each instance is placed at vnodes points of a 64 bit ring; a user belongs
+    to the first point at or after the hash of its UUID. When an instance
+    joins or leaves only the users next to its points change owner. The
+    next instances along the ring hold the backups of a user, so the one
+    taking over a user after its owner leaves already has a replica.
+    """
+
+    def __init__(self, vnodes=100):
+        """Create an empty ring"""
+        self.vnodes = vnodes
+        self.points = []  # Sorted hashes of the virtual nodes
+        self.owners = []  # Proxy owning each point, same order as points
+        self.version = None  # Registry version the ring was built from
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def hash(key) -> int:
+        """Return the position of a key in the ring"""
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def update(self, registry):
+        """Rebuild the ring if the membership of the registry changed since the last build"""
+        registry.expire()  # Instances that stopped announcing leave the ring
+        if registry.version == self.version:
+            return
+        version = registry.version
+        points = sorted((self.hash(f'{Ice.identityToString(prx.ice_getIdentity())}#{i}'), prx)
+                        for prx in registry.proxies() for i in range(self.vnodes))
+        with self.lock:
+            self.points = [point for point, _ in points]
+            self.owners = [prx for _, prx in points]
+            self.version = version
+        print(f'Directory ring rebuilt with {len(points) // max(self.vnodes, 1)} instances')
+
+    def owner(self, key):
+        """Return the proxy of the instance owning a key, None if the ring is empty"""
+        owners = self.successors(key, 1)
+        return owners[0] if owners else None
+
+    def successors(self, key, count):
+        """Return up to count distinct instances found walking the ring from a key, the owner first"""
+        with self.lock:
+            if not self.points:
+                return []
+            position = bisect.bisect_left(self.points, self.hash(key))
+            found = []
+            for i in range(len(self.owners)):
+                prx = self.owners[(position + i) % len(self.owners)]
+                if prx not in found:
+                    found.append(prx)
+                    if len(found) == count:
+                        break
+            return found
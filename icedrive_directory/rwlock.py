@@ -0,0 +1,49 @@
+"""Reader/writer lock shared by every Directory node of a tree."""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Many readers or one writer; waiting writers go before new readers so they never starve.
+
+    Not reentrant: a thread holding the lock must not acquire it again.
+    """
+
+    def __init__(self):
+        """Create the lock, free"""
+        self.readers = 0  # Threads reading
+        self.writer = False  # Some thread is writing
+        self.waiting = 0  # Writers waiting for the readers to leave
+        self.condition = threading.Condition(threading.Lock())
+
+    @contextmanager
+    def reading(self):
+        """Hold the lock shared while the block runs"""
+        with self.condition:
+            while self.writer or self.waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock exclusively while the block runs"""
+        with self.condition:
+            self.waiting += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
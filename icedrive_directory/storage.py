@@ -0,0 +1,235 @@
+"""Storage backends for the directory trees."""
+
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+def joinPath(path, name) -> str:
+    """Return the path of the child name of the directory at path ('%' and '/' in names are escaped)"""
+    name = name.replace('%', '%25').replace('/', '%2F')
+    return f"{path}/{name}" if path else name
+
+
+def splitPath(path) -> list:
+    """Return the names of the directories along a path built with joinPath"""
+    return [re.sub('%(25|2F)', lambda match: '%' if match.group(1) == '25' else '/', name)
+            for name in path.split('/') if name]
+
+
+class Storage(ABC):
+    """Persistence of the tree of one user.
+
+    Directory nodes whose children have not been read yet keep, for each of
+    them, an opaque value returned by the backend; materialize() turns it into
+    the files and children of that directory when it is first accessed.
+    Mutations are journal-style entries: {'op', 'path', 'name'[, 'blobId']}.
+
+    How much is read up front depends on the backend: SqliteStorage reads one
+    directory at a time, the JSON Journal parses the whole tree on load.
+    """
+
+    @abstractmethod
+    def exists(self) -> bool:
+        """Check if there is anything stored for this user"""
+
+    @abstractmethod
+    def create(self, root):
+        """Store the tree of a new user"""
+
+    @abstractmethod
+    def load(self, root):
+        """Fill the root directory with its files and (not materialized) children"""
+
+    @abstractmethod
+    def materialize(self, stored):
+        """Return (files, childs) of a child directory that is still in its stored form"""
+
+    @abstractmethod
+    def subtree(self, stored, maxDepth=-1) -> dict:
+        """Return the serialized form (see Directory.serialize) of a stored child directory, maxDepth levels deep"""
+
+    @abstractmethod
+    def appendMany(self, entries, root):
+        """Persist several mutations of the tree with a single write"""
+
+    def enqueue(self, entries, root):
+        """Persist several mutations in tree order (tree locked), returning the ticket to sync() on"""
+        self.appendMany(entries, root)
+
+    def sync(self, ticket):
+        """Wait until the mutations of an enqueue() are durable (tree unlocked)"""
+
+    def needsCompaction(self) -> bool:
+        """Check if enough mutations were persisted since the last compact() to do another one"""
+        return False
+
+    def dirty(self) -> bool:
+        """Check if compact() would make the next load cheaper"""
+        return False
+
+    def compact(self, root, onlyIfNeeded=False):
+        """Reorganize the stored tree to make the next load cheaper (tree locked for reading at least)"""
+
+    def close(self):
+        """Release the resources used for this user"""
+
+
+class SqliteDatabase:
+    """Embedded SQLite database shared by the SqliteStorage of every user."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, user TEXT NOT NULL, "
+        "parent_id INTEGER NOT NULL, name TEXT NOT NULL)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS nodes_by_parent ON nodes (user, parent_id, name)",
+        "CREATE TABLE IF NOT EXISTS files (node_id INTEGER NOT NULL, name TEXT NOT NULL, "
+        "blob_id TEXT NOT NULL, PRIMARY KEY (node_id, name))",
+    )
+
+    def __init__(self, path):
+        """Open (or create) the database in WAL mode"""
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer
+        self.connection.execute("PRAGMA synchronous=FULL")  # Durable on commit, like the JSON journal
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.lock = threading.Lock()  # One connection, one statement at a time
+
+    def query(self, sql, args=()):
+        """Run a read-only statement and return every row"""
+        with self.lock:
+            return self.connection.execute(sql, args).fetchall()
+
+    def transaction(self, statements):
+        """Run several (sql, args) statements atomically, returning the cursor of the last one"""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, args in statements:
+                    cursor.execute(sql, args)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            return cursor
+
+    def close(self):
+        """Close the connection"""
+        with self.lock:
+            self.connection.close()
+
+
+class SqliteStorage(Storage):
+    """Tree of one user stored as rows of a SqliteDatabase (one indexed row per mutation)."""
+
+    ROOT_PARENT = 0  # parent_id of the root row, real ids start at 1
+
+    def __init__(self, database, uuid, username):
+        """Create the storage of the user with the given UUID"""
+        self.database = database
+        self.uuid = uuid
+        self.username = username
+        self.ids = {}  # Path -> node id of the directories already resolved
+        self.lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Check if the user has a root row"""
+        return self.resolve("") is not None
+
+    def create(self, root):
+        """Insert the root row of a new user"""
+        cursor = self.database.transaction([
+            ("INSERT OR IGNORE INTO nodes (user, parent_id, name) VALUES (?, ?, ?)",
+             (self.uuid, self.ROOT_PARENT, root.name)),
+        ])
+        return cursor.lastrowid
+
+    def load(self, root):
+        """Read the files and the children ids of the root"""
+        root.files, root.childs = self.materialize(self.resolve(""))
+
+    def materialize(self, stored):
+        """Read the files and the children ids of a directory"""
+        files = dict(self.database.query("SELECT name, blob_id FROM files WHERE node_id = ?", (stored,)))
+        childs = {name: node_id for node_id, name in self.database.query(
+            "SELECT id, name FROM nodes WHERE user = ? AND parent_id = ?", (self.uuid, stored))}
+        return files, childs
+
+    def subtree(self, stored, maxDepth=-1) -> dict:
+        """Read a stored subtree in its serialized form, only the child names below maxDepth levels"""
+        name = self.database.query("SELECT name FROM nodes WHERE id = ?", (stored,))[0][0]
+        files, childs = self.materialize(stored)
+        if maxDepth == 0:
+            childs = dict.fromkeys(childs)
+        else:
+            childs = {child: self.subtree(node_id, maxDepth - 1) for child, node_id in childs.items()}
+        return {'name': name, 'user': self.username, 'files': files, 'childs': childs}
+
+    def resolve(self, path):
+        """Return the id of the directory at path (None if missing), using the index once per level"""
+        with self.lock:
+            node_id = self.ids.get(path)
+        if node_id is not None:
+            return node_id
+
+        if path:
+            parent, _, name = path.rpartition('/')
+            name = splitPath(name)[0]
+            parent_id = self.resolve(parent)
+            if parent_id is None:
+                return None
+        else:
+            parent_id, name = self.ROOT_PARENT, None
+        rows = self.database.query(
+            "SELECT id FROM nodes WHERE user = ? AND parent_id = ?" + (" AND name = ?" if path else ""),
+            (self.uuid, parent_id, name) if path else (self.uuid, parent_id))
+        if not rows:
+            return None
+        with self.lock:
+            self.ids[path] = rows[0][0]
+        return rows[0][0]
+
+    def appendMany(self, entries, root):
+        """Apply several mutations in a single transaction"""
+        self.database.transaction([statement for entry in entries for statement in self.statements(entry)])
+        for entry in entries:
+            if entry['op'] == 'rmdir':
+                self.forget(joinPath(entry['path'], entry['name']))
+        return entries
+
+    def statements(self, entry):
+        """Return the (sql, args) statements of one mutation, none if its directory was removed meanwhile"""
+        parent_id = self.resolve(entry['path'])
+        if parent_id is None:  # E.g. a link confirmed after an rmdir of its directory, skipped like in replay
+            return []
+        name = entry['name']
+        if entry['op'] == 'mkdir':
+            return [("INSERT OR IGNORE INTO nodes (user, parent_id, name) VALUES (?, ?, ?)",
+                     (self.uuid, parent_id, name))]
+        if entry['op'] == 'rmdir':
+            subtree = ("WITH RECURSIVE sub(id) AS ("
+                       "SELECT id FROM nodes WHERE user = ? AND parent_id = ? AND name = ? UNION ALL "
+                       "SELECT nodes.id FROM nodes JOIN sub ON nodes.user = ? AND nodes.parent_id = sub.id) ")
+            args = (self.uuid, parent_id, name, self.uuid)
+            return [(subtree + "DELETE FROM files WHERE node_id IN (SELECT id FROM sub)", args),
+                    (subtree + "DELETE FROM nodes WHERE id IN (SELECT id FROM sub)", args)]
+        if entry['op'] == 'link':
+            return [("INSERT OR REPLACE INTO files (node_id, name, blob_id) VALUES (?, ?, ?)",
+                     (parent_id, name, entry['blobId']))]
+        if entry['op'] == 'unlink':
+            return [("DELETE FROM files WHERE node_id = ? AND name = ?", (parent_id, name))]
+        return []
+
+    def forget(self, path):
+        """Drop the cached ids of a removed directory and its descendants"""
+        with self.lock:
+            for cached in [cached for cached in self.ids if cached == path or cached.startswith(path + '/')]:
+                del self.ids[cached]
+
+    def close(self):
+        """Forget the cached ids, the database stays open for other users"""
+        with self.lock:
+            self.ids.clear()
@@ -0,0 +1,176 @@
+"""Supervisor mode: several worker processes of the Directory service behind one announced proxy."""
+
+import logging
+import re
+import subprocess
+import sys
+import threading
+from typing import List
+
+import Ice
+import IceDrive
+import IceStorm
+
+from icedrive_directory.app import DirectoryApp
+from icedrive_directory.directory import DirectoryService
+from icedrive_directory.discovery import Announcer, Discovery
+from icedrive_directory.futures import then
+from icedrive_directory.ring import HashRing
+
+
+class WorkerRouter(IceDrive.DirectoryService):
+    """DirectoryService announced by the supervisor, routes each getRoot to the worker owning the user.
+
+    It stands in for a locator: users are split among the workers by the hash
+    of their UUID, and the root proxy returned is the one of the worker, so
+    every later Directory call goes straight to that process.
+    """
+
+    def __init__(self, workers: List[IceDrive.DirectoryServicePrx], vnodes=100):
+        """Create the router for the given worker proxies"""
+        self.workers = workers
+        self.proxy = None  # Proxy of the supervisor in the ring of announced instances, set by the app
+        self.ring = HashRing(vnodes)  # Users assigned to the instances (supervisors or single processes)
+
+    def getRoot(self, user: IceDrive.UserPrx, current: Ice.Current = None) -> Ice.Future:
+        """Return the root of the user from the worker owning it (dispatched asynchronously)."""
+        forwarded = DirectoryService.FORWARDED in current.ctx
+        return then(user.getUsernameAsync(), lambda username: self.route(username, forwarded)
+                    .getRootAsync(user, {DirectoryService.FORWARDED: '1'}))  # Neither forwards it again
+
+    def route(self, username, forwarded):
+        """Return the service owning a user: other instance of the ring or one of our workers"""
+        uuid = DirectoryService.genUUID(username)
+        if not forwarded and self.proxy is not None:
+            self.ring.update(Discovery.directories)
+            owner = self.ring.owner(uuid)
+            if owner is not None and owner.ice_getIdentity() != self.proxy.ice_getIdentity():
+                return owner
+        return self.workers[DirectoryService.workerOf(uuid, len(self.workers))]
+
+
+class ReplicaRouter(IceDrive.DirectoryReplica):
+    """DirectoryReplica facet of the supervisor, forwards each tree to the worker owning the user.
+
+    Other instances see the supervisor as one member of the ring, so the
+    trees it backs up reach it here and are kept by the same worker that
+    would serve the user after a promotion.
+    """
+
+    def __init__(self, workers: List[IceDrive.DirectoryReplicaPrx]):
+        """Create the router for the replica facets of the workers"""
+        self.workers = workers
+
+    def replicate(self, uuid: str, username: str, epoch: str, firstSeq: int, mutations, current: Ice.Current = None) -> Ice.Future:
+        """Forward a batch of mutations of a tree (dispatched asynchronously)."""
+        return self.route(uuid).replicateAsync(uuid, username, epoch, firstSeq, mutations)
+
+    def install(self, uuid: str, username: str, epoch: str, seq: int, tree: str, current: Ice.Current = None) -> Ice.Future:
+        """Forward the whole tree of a user (dispatched asynchronously)."""
+        return self.route(uuid).installAsync(uuid, username, epoch, seq, tree)
+
+    def route(self, uuid):
+        """Return the replica facet of the worker owning a user"""
+        return self.workers[DirectoryService.workerOf(uuid, len(self.workers))]
+
+
+class SupervisorApp(DirectoryApp):
+    """Runs Directory.Workers worker processes, restarting those that die, and routes users to them."""
+
+    WORKER_IDENTITY = 'DirectoryWorker{}'
+
+    def __init__(self, argv):
+        """Create the supervisor, workers are started with the same command line (argv)"""
+        super().__init__()
+        self.argv = list(argv)
+        self.processes = []
+        self.endpoints = []  # Endpoints of each worker
+        self.supervisor = None  # Our announced proxy, workers back up their trees on the ring as us
+        self.stopping = threading.Event()
+
+    def run(self, args: List[str]) -> int:
+        """Start the workers and announce the router."""
+        properties = self.communicator().getProperties()
+        count = properties.getPropertyAsInt('Directory.Workers')
+        base_port = properties.getPropertyAsIntWithDefault('Directory.Workers.BasePort', 10110)
+        endpoints = properties.getProperty('DirectoryAdapter.Endpoints')
+
+        workers = []
+        for i in range(count):
+            worker_endpoints = self.workerEndpoints(endpoints, base_port + i)
+            self.endpoints.append(worker_endpoints)
+            workers.append(IceDrive.DirectoryServicePrx.uncheckedCast(self.communicator().stringToProxy(
+                f'{self.WORKER_IDENTITY.format(i)}:{worker_endpoints}')))
+
+        adapter = self.communicator().createObjectAdapter("DirectoryAdapter")
+        router = WorkerRouter(workers, properties.getPropertyAsIntWithDefault('Directory.Ring.VirtualNodes', 100))
+        directory = IceDrive.DirectoryServicePrx.uncheckedCast(adapter.addWithUUID(router))
+        replicas = [IceDrive.DirectoryReplicaPrx.uncheckedCast(worker, DirectoryService.REPLICA_FACET)
+                    for worker in workers]
+        adapter.addFacet(ReplicaRouter(replicas), directory.ice_getIdentity(),
+                         DirectoryService.REPLICA_FACET)  # Trees backed up by us, kept by their workers
+        adapter.activate()
+        router.proxy = directory
+        self.supervisor = self.communicator().proxyToString(directory)
+        logging.info("Proxy: %s (%d workers)", directory, count)
+
+        for i in range(count):  # They need our proxy
+            self.processes.append(self.spawn(i, self.endpoints[i]))
+        monitor = threading.Thread(target=self.monitor, name='Supervisor', daemon=True)
+        monitor.start()
+
+        # Discovery: the supervisor is the member of the ring, the workers only listen
+        tp_manager = IceStorm.TopicManagerPrx.checkedCast(
+            self.communicator().propertyToProxy('IceStorm.TopicManager.Proxy'))
+        intervals = self.announceIntervals(properties)
+        discovery_adapter = self.communicator().createObjectAdapter("DiscoveryAdapter")
+        discovery_adapter.activate()
+        discovery_tp, subscriber = self.subscribe(tp_manager, properties.getProperty('DiscoveryTopic'),
+                                                  discovery_adapter, Discovery())
+        discovery = IceDrive.DiscoveryPrx.uncheckedCast(discovery_tp.getPublisher().ice_oneway())
+        announcer = Announcer(lambda: discovery.announceDirectoryService(prx=directory), **intervals)
+        announcer.start()
+
+        self.shutdownOnInterrupt()
+        self.communicator().waitForShutdown()
+
+        announcer.stop()
+        self.unsubscribe((discovery_tp, subscriber))
+        self.stopping.set()
+        monitor.join()
+        for process in self.processes:  # Each worker writes back its trees on SIGTERM
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return 0
+
+    @staticmethod
+    def workerEndpoints(endpoints, port):
+        """Return the endpoints of the supervisor with the port of a worker"""
+        if re.search(r'-p\s+\d+', endpoints):
+            return re.sub(r'-p\s+\d+', f'-p {port}', endpoints)
+        return f'{endpoints} -p {port}'
+
+    def spawn(self, index, endpoints):
+        """Start one worker process"""
+        command = [sys.executable, '-m', 'icedrive_directory.command_line_handlers'] + self.argv[1:] + [
+            f'--Directory.Workers={len(self.endpoints)}',  # To tell which users are its own
+            f'--Directory.Worker={index}',  # Not a supervisor itself
+            f'--Directory.Identity={self.WORKER_IDENTITY.format(index)}',
+            f'--Directory.Supervisor={self.supervisor}',
+            f'--DirectoryAdapter.Endpoints={endpoints}',
+            '--DiscoveryAdapter.Endpoints=tcp',  # Any free port
+        ]
+        print(f'Starting worker {index} on {endpoints}')
+        return subprocess.Popen(command)
+
+    def monitor(self):
+        """Restart the workers that exit unexpectedly"""
+        while not self.stopping.wait(1.0):
+            for i, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    logging.warning('Worker %d exited with %s, restarting it', i, process.returncode)
+                    self.processes[i] = self.spawn(i, self.endpoints[i])
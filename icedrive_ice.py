@@ -27,6 +27,347 @@ if '_t_Bytes' not in _M_IceDrive.__dict__:
 if '_t_Strings' not in _M_IceDrive.__dict__:
     _M_IceDrive._t_Strings = IcePy.defineSequence('::IceDrive::Strings', (), IcePy._t_string)
 
+if '_t_FileMap' not in _M_IceDrive.__dict__:
+    _M_IceDrive._t_FileMap = IcePy.defineDictionary('::IceDrive::FileMap', (), IcePy._t_string, IcePy._t_string)
+
+if 'TreeNode' not in _M_IceDrive.__dict__:
+    _M_IceDrive.TreeNode = Ice.createTempClass()
+    class TreeNode(object):
+        def __init__(self, name='', path='', parent=0, depth=0, childs=None, files=None):
+            self.name = name
+            self.path = path
+            self.parent = parent
+            self.depth = depth
+            self.childs = childs
+            self.files = files
+
+        def __hash__(self):
+            _h = 0
+            _h = 5 * _h + Ice.getHash(self.name)
+            _h = 5 * _h + Ice.getHash(self.path)
+            _h = 5 * _h + Ice.getHash(self.parent)
+            _h = 5 * _h + Ice.getHash(self.depth)
+            if self.childs:
+                for _i0 in self.childs:
+                    _h = 5 * _h + Ice.getHash(_i0)
+            if self.files:
+                for _i1 in self.files:
+                    _h = 5 * _h + Ice.getHash(_i1)
+                    _h = 5 * _h + Ice.getHash(self.files[_i1])
+            return _h % 0x7fffffff
+
+        def __compare(self, other):
+            if other is None:
+                return 1
+            elif not isinstance(other, _M_IceDrive.TreeNode):
+                return NotImplemented
+            else:
+                if self.name is None or other.name is None:
+                    if self.name != other.name:
+                        return (-1 if self.name is None else 1)
+                else:
+                    if self.name < other.name:
+                        return -1
+                    elif self.name > other.name:
+                        return 1
+                if self.path is None or other.path is None:
+                    if self.path != other.path:
+                        return (-1 if self.path is None else 1)
+                else:
+                    if self.path < other.path:
+                        return -1
+                    elif self.path > other.path:
+                        return 1
+                if self.parent is None or other.parent is None:
+                    if self.parent != other.parent:
+                        return (-1 if self.parent is None else 1)
+                else:
+                    if self.parent < other.parent:
+                        return -1
+                    elif self.parent > other.parent:
+                        return 1
+                if self.depth is None or other.depth is None:
+                    if self.depth != other.depth:
+                        return (-1 if self.depth is None else 1)
+                else:
+                    if self.depth < other.depth:
+                        return -1
+                    elif self.depth > other.depth:
+                        return 1
+                if self.childs is None or other.childs is None:
+                    if self.childs != other.childs:
+                        return (-1 if self.childs is None else 1)
+                else:
+                    if self.childs < other.childs:
+                        return -1
+                    elif self.childs > other.childs:
+                        return 1
+                if self.files != other.files:
+                    return NotImplemented
+                return 0
+
+        def __lt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r < 0
+
+        def __le__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r <= 0
+
+        def __gt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r > 0
+
+        def __ge__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r >= 0
+
+        def __eq__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r == 0
+
+        def __ne__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r != 0
+
+        def __str__(self):
+            return IcePy.stringify(self, _M_IceDrive._t_TreeNode)
+
+        __repr__ = __str__
+
+    _M_IceDrive._t_TreeNode = IcePy.defineStruct('::IceDrive::TreeNode', TreeNode, (), (
+        ('name', (), IcePy._t_string),
+        ('path', (), IcePy._t_string),
+        ('parent', (), IcePy._t_int),
+        ('depth', (), IcePy._t_int),
+        ('childs', (), _M_IceDrive._t_Strings),
+        ('files', (), _M_IceDrive._t_FileMap)
+    ))
+
+    _M_IceDrive.TreeNode = TreeNode
+    del TreeNode
+
+if '_t_TreeNodes' not in _M_IceDrive.__dict__:
+    _M_IceDrive._t_TreeNodes = IcePy.defineSequence('::IceDrive::TreeNodes', (), _M_IceDrive._t_TreeNode)
+
+if 'DirectoryTree' not in _M_IceDrive.__dict__:
+    _M_IceDrive.DirectoryTree = Ice.createTempClass()
+    class DirectoryTree(object):
+        def __init__(self, path='', nodes=None):
+            self.path = path
+            self.nodes = nodes
+
+        def __hash__(self):
+            _h = 0
+            _h = 5 * _h + Ice.getHash(self.path)
+            if self.nodes:
+                for _i0 in self.nodes:
+                    _h = 5 * _h + Ice.getHash(_i0)
+            return _h % 0x7fffffff
+
+        def __compare(self, other):
+            if other is None:
+                return 1
+            elif not isinstance(other, _M_IceDrive.DirectoryTree):
+                return NotImplemented
+            else:
+                if self.path is None or other.path is None:
+                    if self.path != other.path:
+                        return (-1 if self.path is None else 1)
+                else:
+                    if self.path < other.path:
+                        return -1
+                    elif self.path > other.path:
+                        return 1
+                if self.nodes is None or other.nodes is None:
+                    if self.nodes != other.nodes:
+                        return (-1 if self.nodes is None else 1)
+                else:
+                    if self.nodes < other.nodes:
+                        return -1
+                    elif self.nodes > other.nodes:
+                        return 1
+                return 0
+
+        def __lt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r < 0
+
+        def __le__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r <= 0
+
+        def __gt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r > 0
+
+        def __ge__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r >= 0
+
+        def __eq__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r == 0
+
+        def __ne__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r != 0
+
+        def __str__(self):
+            return IcePy.stringify(self, _M_IceDrive._t_DirectoryTree)
+
+        __repr__ = __str__
+
+    _M_IceDrive._t_DirectoryTree = IcePy.defineStruct('::IceDrive::DirectoryTree', DirectoryTree, (), (
+        ('path', (), IcePy._t_string),
+        ('nodes', (), _M_IceDrive._t_TreeNodes)
+    ))
+
+    _M_IceDrive.DirectoryTree = DirectoryTree
+    del DirectoryTree
+
+if 'ItemResult' not in _M_IceDrive.__dict__:
+    _M_IceDrive.ItemResult = Ice.createTempClass()
+    class ItemResult(object):
+        def __init__(self, name='', ok=False, error=''):
+            self.name = name
+            self.ok = ok
+            self.error = error
+
+        def __hash__(self):
+            _h = 0
+            _h = 5 * _h + Ice.getHash(self.name)
+            _h = 5 * _h + Ice.getHash(self.ok)
+            _h = 5 * _h + Ice.getHash(self.error)
+            return _h % 0x7fffffff
+
+        def __compare(self, other):
+            if other is None:
+                return 1
+            elif not isinstance(other, _M_IceDrive.ItemResult):
+                return NotImplemented
+            else:
+                if self.name is None or other.name is None:
+                    if self.name != other.name:
+                        return (-1 if self.name is None else 1)
+                else:
+                    if self.name < other.name:
+                        return -1
+                    elif self.name > other.name:
+                        return 1
+                if self.ok is None or other.ok is None:
+                    if self.ok != other.ok:
+                        return (-1 if self.ok is None else 1)
+                else:
+                    if self.ok < other.ok:
+                        return -1
+                    elif self.ok > other.ok:
+                        return 1
+                if self.error is None or other.error is None:
+                    if self.error != other.error:
+                        return (-1 if self.error is None else 1)
+                else:
+                    if self.error < other.error:
+                        return -1
+                    elif self.error > other.error:
+                        return 1
+                return 0
+
+        def __lt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r < 0
+
+        def __le__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r <= 0
+
+        def __gt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r > 0
+
+        def __ge__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r >= 0
+
+        def __eq__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r == 0
+
+        def __ne__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r != 0
+
+        def __str__(self):
+            return IcePy.stringify(self, _M_IceDrive._t_ItemResult)
+
+        __repr__ = __str__
+
+    _M_IceDrive._t_ItemResult = IcePy.defineStruct('::IceDrive::ItemResult', ItemResult, (), (
+        ('name', (), IcePy._t_string),
+        ('ok', (), IcePy._t_bool),
+        ('error', (), IcePy._t_string)
+    ))
+
+    _M_IceDrive.ItemResult = ItemResult
+    del ItemResult
+
+if '_t_ItemResults' not in _M_IceDrive.__dict__:
+    _M_IceDrive._t_ItemResults = IcePy.defineSequence('::IceDrive::ItemResults', (), _M_IceDrive._t_ItemResult)
+
 if 'Unauthorized' not in _M_IceDrive.__dict__:
     _M_IceDrive.Unauthorized = Ice.createTempClass()
     class Unauthorized(Ice.UserException):
@@ -1210,6 +1551,78 @@ if 'DirectoryPrx' not in _M_IceDrive.__dict__:
         def end_unlinkFile(self, _r):
             return _M_IceDrive.Directory._op_unlinkFile.end(self, _r)
 
+        def resolve(self, path, context=None):
+            return _M_IceDrive.Directory._op_resolve.invoke(self, ((path, ), context))
+
+        def resolveAsync(self, path, context=None):
+            return _M_IceDrive.Directory._op_resolve.invokeAsync(self, ((path, ), context))
+
+        def begin_resolve(self, path, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_resolve.begin(self, ((path, ), _response, _ex, _sent, context))
+
+        def end_resolve(self, _r):
+            return _M_IceDrive.Directory._op_resolve.end(self, _r)
+
+        def resolveFile(self, path, context=None):
+            return _M_IceDrive.Directory._op_resolveFile.invoke(self, ((path, ), context))
+
+        def resolveFileAsync(self, path, context=None):
+            return _M_IceDrive.Directory._op_resolveFile.invokeAsync(self, ((path, ), context))
+
+        def begin_resolveFile(self, path, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_resolveFile.begin(self, ((path, ), _response, _ex, _sent, context))
+
+        def end_resolveFile(self, _r):
+            return _M_IceDrive.Directory._op_resolveFile.end(self, _r)
+
+        def getTree(self, maxDepth, context=None):
+            return _M_IceDrive.Directory._op_getTree.invoke(self, ((maxDepth, ), context))
+
+        def getTreeAsync(self, maxDepth, context=None):
+            return _M_IceDrive.Directory._op_getTree.invokeAsync(self, ((maxDepth, ), context))
+
+        def begin_getTree(self, maxDepth, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_getTree.begin(self, ((maxDepth, ), _response, _ex, _sent, context))
+
+        def end_getTree(self, _r):
+            return _M_IceDrive.Directory._op_getTree.end(self, _r)
+
+        def createChildren(self, childNames, context=None):
+            return _M_IceDrive.Directory._op_createChildren.invoke(self, ((childNames, ), context))
+
+        def createChildrenAsync(self, childNames, context=None):
+            return _M_IceDrive.Directory._op_createChildren.invokeAsync(self, ((childNames, ), context))
+
+        def begin_createChildren(self, childNames, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_createChildren.begin(self, ((childNames, ), _response, _ex, _sent, context))
+
+        def end_createChildren(self, _r):
+            return _M_IceDrive.Directory._op_createChildren.end(self, _r)
+
+        def linkFiles(self, files, context=None):
+            return _M_IceDrive.Directory._op_linkFiles.invoke(self, ((files, ), context))
+
+        def linkFilesAsync(self, files, context=None):
+            return _M_IceDrive.Directory._op_linkFiles.invokeAsync(self, ((files, ), context))
+
+        def begin_linkFiles(self, files, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_linkFiles.begin(self, ((files, ), _response, _ex, _sent, context))
+
+        def end_linkFiles(self, _r):
+            return _M_IceDrive.Directory._op_linkFiles.end(self, _r)
+
+        def unlinkFiles(self, fileNames, context=None):
+            return _M_IceDrive.Directory._op_unlinkFiles.invoke(self, ((fileNames, ), context))
+
+        def unlinkFilesAsync(self, fileNames, context=None):
+            return _M_IceDrive.Directory._op_unlinkFiles.invokeAsync(self, ((fileNames, ), context))
+
+        def begin_unlinkFiles(self, fileNames, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.Directory._op_unlinkFiles.begin(self, ((fileNames, ), _response, _ex, _sent, context))
+
+        def end_unlinkFiles(self, _r):
+            return _M_IceDrive.Directory._op_unlinkFiles.end(self, _r)
+
         @staticmethod
         def checkedCast(proxy, facetOrContext=None, context=None):
             return _M_IceDrive.DirectoryPrx.ice_checkedCast(proxy, '::IceDrive::Directory', facetOrContext, context)
@@ -1269,6 +1682,24 @@ if 'DirectoryPrx' not in _M_IceDrive.__dict__:
         def unlinkFile(self, fileName, current=None):
             raise NotImplementedError("servant method 'unlinkFile' not implemented")
 
+        def resolve(self, path, current=None):
+            raise NotImplementedError("servant method 'resolve' not implemented")
+
+        def resolveFile(self, path, current=None):
+            raise NotImplementedError("servant method 'resolveFile' not implemented")
+
+        def getTree(self, maxDepth, current=None):
+            raise NotImplementedError("servant method 'getTree' not implemented")
+
+        def createChildren(self, childNames, current=None):
+            raise NotImplementedError("servant method 'createChildren' not implemented")
+
+        def linkFiles(self, files, current=None):
+            raise NotImplementedError("servant method 'linkFiles' not implemented")
+
+        def unlinkFiles(self, fileNames, current=None):
+            raise NotImplementedError("servant method 'unlinkFiles' not implemented")
+
         def __str__(self):
             return IcePy.stringify(self, _M_IceDrive._t_DirectoryDisp)
 
@@ -1287,6 +1718,12 @@ if 'DirectoryPrx' not in _M_IceDrive.__dict__:
     Directory._op_getBlobId = IcePy.Operation('getBlobId', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0),), (), ((), IcePy._t_string, False, 0), (_M_IceDrive._t_FileNotFound, _M_IceDrive._t_Unauthorized))
     Directory._op_linkFile = IcePy.Operation('linkFile', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0), ((), IcePy._t_string, False, 0)), (), None, (_M_IceDrive._t_FileAlreadyExists, _M_IceDrive._t_Unauthorized, _M_IceDrive._t_TemporaryUnavailable))
     Directory._op_unlinkFile = IcePy.Operation('unlinkFile', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0),), (), None, (_M_IceDrive._t_FileNotFound, _M_IceDrive._t_Unauthorized, _M_IceDrive._t_TemporaryUnavailable))
+    Directory._op_resolve = IcePy.Operation('resolve', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0),), (), ((), _M_IceDrive._t_DirectoryPrx, False, 0), (_M_IceDrive._t_ChildNotExists, _M_IceDrive._t_Unauthorized))
+    Directory._op_resolveFile = IcePy.Operation('resolveFile', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0),), (), ((), IcePy._t_string, False, 0), (_M_IceDrive._t_ChildNotExists, _M_IceDrive._t_FileNotFound, _M_IceDrive._t_Unauthorized))
+    Directory._op_getTree = IcePy.Operation('getTree', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_int, False, 0),), (), ((), _M_IceDrive._t_DirectoryTree, False, 0), (_M_IceDrive._t_Unauthorized,))
+    Directory._op_createChildren = IcePy.Operation('createChildren', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), _M_IceDrive._t_Strings, False, 0),), (), ((), _M_IceDrive._t_ItemResults, False, 0), (_M_IceDrive._t_Unauthorized,))
+    Directory._op_linkFiles = IcePy.Operation('linkFiles', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), _M_IceDrive._t_FileMap, False, 0),), (), ((), _M_IceDrive._t_ItemResults, False, 0), (_M_IceDrive._t_Unauthorized, _M_IceDrive._t_TemporaryUnavailable))
+    Directory._op_unlinkFiles = IcePy.Operation('unlinkFiles', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), _M_IceDrive._t_Strings, False, 0),), (), ((), _M_IceDrive._t_ItemResults, False, 0), (_M_IceDrive._t_Unauthorized, _M_IceDrive._t_TemporaryUnavailable))
 
     _M_IceDrive.Directory = Directory
     del Directory
@@ -1480,6 +1917,213 @@ if 'DirectoryQueryPrx' not in _M_IceDrive.__dict__:
     _M_IceDrive.DirectoryQuery = DirectoryQuery
     del DirectoryQuery
 
+if 'Mutation' not in _M_IceDrive.__dict__:
+    _M_IceDrive.Mutation = Ice.createTempClass()
+    class Mutation(object):
+        def __init__(self, seq=0, op='', path='', name='', blobId=''):
+            self.seq = seq
+            self.op = op
+            self.path = path
+            self.name = name
+            self.blobId = blobId
+
+        def __hash__(self):
+            _h = 0
+            _h = 5 * _h + Ice.getHash(self.seq)
+            _h = 5 * _h + Ice.getHash(self.op)
+            _h = 5 * _h + Ice.getHash(self.path)
+            _h = 5 * _h + Ice.getHash(self.name)
+            _h = 5 * _h + Ice.getHash(self.blobId)
+            return _h % 0x7fffffff
+
+        def __compare(self, other):
+            if other is None:
+                return 1
+            elif not isinstance(other, _M_IceDrive.Mutation):
+                return NotImplemented
+            else:
+                if self.seq is None or other.seq is None:
+                    if self.seq != other.seq:
+                        return (-1 if self.seq is None else 1)
+                else:
+                    if self.seq < other.seq:
+                        return -1
+                    elif self.seq > other.seq:
+                        return 1
+                if self.op is None or other.op is None:
+                    if self.op != other.op:
+                        return (-1 if self.op is None else 1)
+                else:
+                    if self.op < other.op:
+                        return -1
+                    elif self.op > other.op:
+                        return 1
+                if self.path is None or other.path is None:
+                    if self.path != other.path:
+                        return (-1 if self.path is None else 1)
+                else:
+                    if self.path < other.path:
+                        return -1
+                    elif self.path > other.path:
+                        return 1
+                if self.name is None or other.name is None:
+                    if self.name != other.name:
+                        return (-1 if self.name is None else 1)
+                else:
+                    if self.name < other.name:
+                        return -1
+                    elif self.name > other.name:
+                        return 1
+                if self.blobId is None or other.blobId is None:
+                    if self.blobId != other.blobId:
+                        return (-1 if self.blobId is None else 1)
+                else:
+                    if self.blobId < other.blobId:
+                        return -1
+                    elif self.blobId > other.blobId:
+                        return 1
+                return 0
+
+        def __lt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r < 0
+
+        def __le__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r <= 0
+
+        def __gt__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r > 0
+
+        def __ge__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r >= 0
+
+        def __eq__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r == 0
+
+        def __ne__(self, other):
+            r = self.__compare(other)
+            if r is NotImplemented:
+                return r
+            else:
+                return r != 0
+
+        def __str__(self):
+            return IcePy.stringify(self, _M_IceDrive._t_Mutation)
+
+        __repr__ = __str__
+
+    _M_IceDrive._t_Mutation = IcePy.defineStruct('::IceDrive::Mutation', Mutation, (), (
+        ('seq', (), IcePy._t_long),
+        ('op', (), IcePy._t_string),
+        ('path', (), IcePy._t_string),
+        ('name', (), IcePy._t_string),
+        ('blobId', (), IcePy._t_string)
+    ))
+
+    _M_IceDrive.Mutation = Mutation
+    del Mutation
+
+if '_t_Mutations' not in _M_IceDrive.__dict__:
+    _M_IceDrive._t_Mutations = IcePy.defineSequence('::IceDrive::Mutations', (), _M_IceDrive._t_Mutation)
+
+_M_IceDrive._t_DirectoryReplica = IcePy.defineValue('::IceDrive::DirectoryReplica', Ice.Value, -1, (), False, True, None, ())
+
+if 'DirectoryReplicaPrx' not in _M_IceDrive.__dict__:
+    _M_IceDrive.DirectoryReplicaPrx = Ice.createTempClass()
+    class DirectoryReplicaPrx(Ice.ObjectPrx):
+
+        def replicate(self, uuid, username, epoch, firstSeq, mutations, context=None):
+            return _M_IceDrive.DirectoryReplica._op_replicate.invoke(self, ((uuid, username, epoch, firstSeq, mutations), context))
+
+        def replicateAsync(self, uuid, username, epoch, firstSeq, mutations, context=None):
+            return _M_IceDrive.DirectoryReplica._op_replicate.invokeAsync(self, ((uuid, username, epoch, firstSeq, mutations), context))
+
+        def begin_replicate(self, uuid, username, epoch, firstSeq, mutations, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.DirectoryReplica._op_replicate.begin(self, ((uuid, username, epoch, firstSeq, mutations), _response, _ex, _sent, context))
+
+        def end_replicate(self, _r):
+            return _M_IceDrive.DirectoryReplica._op_replicate.end(self, _r)
+
+        def install(self, uuid, username, epoch, seq, tree, context=None):
+            return _M_IceDrive.DirectoryReplica._op_install.invoke(self, ((uuid, username, epoch, seq, tree), context))
+
+        def installAsync(self, uuid, username, epoch, seq, tree, context=None):
+            return _M_IceDrive.DirectoryReplica._op_install.invokeAsync(self, ((uuid, username, epoch, seq, tree), context))
+
+        def begin_install(self, uuid, username, epoch, seq, tree, _response=None, _ex=None, _sent=None, context=None):
+            return _M_IceDrive.DirectoryReplica._op_install.begin(self, ((uuid, username, epoch, seq, tree), _response, _ex, _sent, context))
+
+        def end_install(self, _r):
+            return _M_IceDrive.DirectoryReplica._op_install.end(self, _r)
+
+        @staticmethod
+        def checkedCast(proxy, facetOrContext=None, context=None):
+            return _M_IceDrive.DirectoryReplicaPrx.ice_checkedCast(proxy, '::IceDrive::DirectoryReplica', facetOrContext, context)
+
+        @staticmethod
+        def uncheckedCast(proxy, facet=None):
+            return _M_IceDrive.DirectoryReplicaPrx.ice_uncheckedCast(proxy, facet)
+
+        @staticmethod
+        def ice_staticId():
+            return '::IceDrive::DirectoryReplica'
+    _M_IceDrive._t_DirectoryReplicaPrx = IcePy.defineProxy('::IceDrive::DirectoryReplica', DirectoryReplicaPrx)
+
+    _M_IceDrive.DirectoryReplicaPrx = DirectoryReplicaPrx
+    del DirectoryReplicaPrx
+
+    _M_IceDrive.DirectoryReplica = Ice.createTempClass()
+    class DirectoryReplica(Ice.Object):
+
+        def ice_ids(self, current=None):
+            return ('::Ice::Object', '::IceDrive::DirectoryReplica')
+
+        def ice_id(self, current=None):
+            return '::IceDrive::DirectoryReplica'
+
+        @staticmethod
+        def ice_staticId():
+            return '::IceDrive::DirectoryReplica'
+
+        def replicate(self, uuid, username, epoch, firstSeq, mutations, current=None):
+            raise NotImplementedError("servant method 'replicate' not implemented")
+
+        def install(self, uuid, username, epoch, seq, tree, current=None):
+            raise NotImplementedError("servant method 'install' not implemented")
+
+        def __str__(self):
+            return IcePy.stringify(self, _M_IceDrive._t_DirectoryReplicaDisp)
+
+        __repr__ = __str__
+
+    _M_IceDrive._t_DirectoryReplicaDisp = IcePy.defineClass('::IceDrive::DirectoryReplica', DirectoryReplica, (), None, ())
+    DirectoryReplica._ice_type = _M_IceDrive._t_DirectoryReplicaDisp
+
+    DirectoryReplica._op_replicate = IcePy.Operation('replicate', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0), ((), IcePy._t_string, False, 0), ((), IcePy._t_string, False, 0), ((), IcePy._t_long, False, 0), ((), _M_IceDrive._t_Mutations, False, 0)), (), ((), IcePy._t_long, False, 0), ())
+    DirectoryReplica._op_install = IcePy.Operation('install', Ice.OperationMode.Normal, Ice.OperationMode.Normal, False, None, (), (((), IcePy._t_string, False, 0), ((), IcePy._t_string, False, 0), ((), IcePy._t_string, False, 0), ((), IcePy._t_long, False, 0), ((), IcePy._t_string, False, 0)), (), None, ())
+
+    _M_IceDrive.DirectoryReplica = DirectoryReplica
+    del DirectoryReplica
+
 _M_IceDrive._t_Discovery = IcePy.defineValue('::IceDrive::Discovery', Ice.Value, -1, (), False, True, None, ())
 
 if 'DiscoveryPrx' not in _M_IceDrive.__dict__:
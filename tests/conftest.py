@@ -0,0 +1,44 @@
+"""Fixtures shared by the tests: a scratch data directory, discovered services and a user tree."""
+
+import pytest
+
+from icedrive_directory.directory import DirectoryService
+from icedrive_directory.discovery import Discovery, ServiceRegistry
+from tests.helpers import Alive, FakeBlob
+
+
+@pytest.fixture(autouse=True)
+def registries(monkeypatch):
+    """Fresh Discovery registries for every test, they are global"""
+    for name in ('authenticators', 'directories', 'blobs'):
+        monkeypatch.setattr(Discovery, name, ServiceRegistry())
+    return Discovery
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test in an empty directory, the service keeps its data in ./USRDIRS/"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def blob(registries):
+    """A discovered Blob service"""
+    service = FakeBlob()
+    registries.blobs.announce(service)
+    return service
+
+
+@pytest.fixture
+def service(workdir):
+    """A DirectoryService with the default configuration"""
+    directory_service = DirectoryService()
+    yield directory_service
+    directory_service.shutdown()
+
+
+@pytest.fixture
+def root(service):
+    """The tree of a new user"""
+    return service.loadRoot(service.genUUID('bob'), 'bob', None, Alive())
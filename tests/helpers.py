@@ -0,0 +1,96 @@
+"""Stand-ins for the remote services and for Ice.Current, used by the tests."""
+
+import collections
+
+import Ice
+
+
+class Alive:
+    """Liveness of a user that is always alive"""
+
+    def isAlive(self):
+        """The user is alive"""
+        return True
+
+    def isAliveAsync(self):
+        """The user is alive, as a future"""
+        future = Ice.Future()
+        future.set_result(True)
+        return future
+
+
+class Adapter:
+    """Object adapter stand-in, the tests call the servants directly"""
+
+    def createProxy(self, identity):
+        """No proxy is needed"""
+        return None
+
+
+class Current:
+    """Ice.Current stand-in for servant calls made directly"""
+
+    adapter = Adapter()
+    ctx = {}
+
+
+class FakeBlob:
+    """BlobService stand-in counting the references of each blob.
+
+    It replies right away unless hold is set, then the calls wait for
+    release(). With error set, every call fails with it.
+    """
+
+    def __init__(self, name='blob', hold=False, error=None):
+        """Create the service"""
+        self.identity = Ice.Identity(name, '')
+        self.hold = hold
+        self.error = error
+        self.refs = collections.Counter()  # Blob id -> references taken
+        self.calls = 0
+        self.held = []  # (future, blob_id, delta) waiting for release()
+
+    def ice_getIdentity(self):
+        """Identity of the service"""
+        return self.identity
+
+    def linkAsync(self, blob_id):
+        """Take a reference"""
+        return self.reply(blob_id, 1)
+
+    def unlinkAsync(self, blob_id):
+        """Give back a reference"""
+        return self.reply(blob_id, -1)
+
+    def reply(self, blob_id, delta):
+        """Answer a call, or keep it for release()"""
+        self.calls += 1
+        future = Ice.Future()
+        future.is_sent = lambda: True  # Like the invocation future of a proxy, it already left
+        if self.error is not None:
+            future.set_exception(self.error)
+        elif self.hold:
+            self.held.append((future, blob_id, delta))
+        else:
+            self.refs[blob_id] += delta
+            future.set_result(None)
+        return future
+
+    def release(self):
+        """Answer the calls held so far"""
+        held, self.held = self.held, []
+        for future, blob_id, delta in held:
+            self.refs[blob_id] += delta
+            future.set_result(None)
+
+
+class FakeProxy:
+    """Proxy stand-in that only has an identity"""
+
+    def __init__(self, name):
+        """Create the proxy"""
+        self.identity = Ice.Identity(name, '')
+
+    def ice_getIdentity(self):
+        """Identity of the proxy"""
+        return self.identity
@@ -0,0 +1,17 @@
+"""Tests of the Directory service application."""
+
+import logging
+import threading
+
+from icedrive_directory.app import DirectoryApp
+
+
+def test_stats_are_logged_while_running(service, caplog):
+    stopped = threading.Event()
+    logger = threading.Thread(target=DirectoryApp.logStats, args=(service, 0.01, stopped))
+    with caplog.at_level(logging.INFO):
+        logger.start()
+        stopped.wait(0.1)
+        stopped.set()
+        logger.join(1)
+    assert 'Directory service stats' in caplog.text and "'backends'" in caplog.text
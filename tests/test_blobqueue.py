@@ -0,0 +1,103 @@
+"""Tests of the queue of link/unlink requests sent to the Blob services."""
+
+import Ice
+import IceDrive
+import pytest
+
+from icedrive_directory.blobqueue import BlobQueue
+from tests.helpers import FakeBlob
+
+
+def announce(registries, *services):
+    """Make Blob services discoverable"""
+    for service in services:
+        registries.blobs.announce(service)
+    return services
+
+
+def test_queue_needs_a_blob_service():
+    with pytest.raises(IceDrive.TemporaryUnavailable):
+        BlobQueue().link('A')
+
+
+def test_requests_wait_for_the_window(blob):
+    queue = BlobQueue(window=10)
+    futures = [queue.link('A'), queue.unlink('B')]
+    assert blob.calls == 0 and queue.stats()['queued'] == 2
+    queue.flush()
+    assert all(future.result(1) is None for future in futures)
+    assert blob.refs == {'A': 1, 'B': -1}
+
+
+def test_full_lane_is_sent_without_waiting(blob):
+    queue = BlobQueue(window=10, maxBatch=3)
+    futures = [queue.link(f'B{i}') for i in range(3)]
+    assert all(future.result(1) is None for future in futures)
+    assert queue.stats()['lanes'] == 0
+
+
+def test_each_service_has_its_own_lane(registries):
+    services = announce(registries, FakeBlob('b1'), FakeBlob('b2'))
+    queue = BlobQueue(window=10)
+    futures = [queue.link(f'B{i}') for i in range(40)]
+    assert queue.stats()['lanes'] == 2
+    queue.flush()
+    assert all(future.result(1) is None for future in futures)
+    assert sum(service.calls for service in services) == 40
+
+
+def test_cancelled_request_never_leaves(blob):
+    queue = BlobQueue(window=10)
+    link, other = queue.link('A'), queue.link('A')
+    assert queue.cancel(link)
+    assert isinstance(link.exception(1), Ice.InvocationCanceledException)
+    queue.flush()
+    assert other.result(1) is None
+    assert blob.calls == 1 and blob.refs['A'] == 1
+    assert queue.stats()['cancelled'] == 1
+
+
+def test_sent_request_can_not_be_cancelled(blob):
+    queue = BlobQueue(window=10)
+    link = queue.link('A')
+    queue.flush()
+    assert not queue.cancel(link)
+    assert link.result(1) is None
+
+
+def test_failed_request_is_retried_on_another_replica(registries):
+    down = FakeBlob('down', error=Ice.ConnectionRefusedException())
+    announce(registries, down)
+    queue = BlobQueue(window=10)
+    link = queue.link('A')  # Queued for the only replica known
+    up, = announce(registries, FakeBlob('up'))
+    queue.flush()
+    assert link.result(1) is None
+    assert down.calls == 1 and up.refs['A'] == 1
+    assert queue.stats()['retried'] == 1
+
+
+def test_request_fails_after_the_retries(registries):
+    down = FakeBlob('down', error=Ice.ConnectionRefusedException())
+    announce(registries, down)
+    queue = BlobQueue(window=10, retries=0)
+    link = queue.link('A')
+    queue.flush()
+    assert isinstance(link.exception(1), Ice.ConnectionRefusedException)
+
+
+
+def test_slow_request_is_hedged_and_the_loser_undone(registries):
+    slow = FakeBlob('slow', hold=True)
+    announce(registries, slow)
+    queue = BlobQueue(window=10, initialDelay=0.01)
+    link = queue.link('A')
+    fast, = announce(registries, FakeBlob('fast'))
+    queue.flush()
+    assert link.result(2) is None  # Answered by the hedge
+    assert fast.refs['A'] == 1
+
+    slow.release()  # The first copy succeeds too, so it is undone
+    slow.release()
+    assert slow.refs['A'] == 0
+    assert queue.stats()['hedged'] == 1 and queue.stats()['compensated'] == 1
@@ -0,0 +1,154 @@
+"""Tests of the liveness, verified users and loaded trees caches."""
+
+import Ice
+
+from icedrive_directory.cache import LivenessCache, RootCache, VerifiedCache
+from icedrive_directory.futures import completed
+from tests.helpers import Adapter, Alive, FakeProxy
+
+
+class Session(FakeProxy):
+    """User proxy stand-in counting the liveness checks"""
+
+    def __init__(self, name, alive=True):
+        """Create the session"""
+        super().__init__(name)
+        self.alive = alive
+        self.calls = 0
+
+    def isAlive(self):
+        """Liveness of the session"""
+        self.calls += 1
+        return self.alive
+
+    def isAliveAsync(self):
+        """Liveness of the session, as a future"""
+        return completed(self.isAlive())
+
+
+class Tree:
+    """Loaded tree stand-in"""
+
+    def __init__(self, nodes=1):
+        """Create the tree"""
+        self.nodes = nodes
+
+
+def test_liveness_is_cached_per_session():
+    cache = LivenessCache(ttl=60)
+    session = Session('s1')
+    user = cache.get('bob', session)
+    assert user.isAlive() and user.isAlive()
+    assert session.calls == 1
+    assert user.session(session).isAliveAsync().result() is True
+    assert session.calls == 1
+
+
+def test_user_is_alive_while_any_session_is():
+    dead = []
+    cache = LivenessCache(ttl=60, onDead=dead.append)
+    alive, ended = Session('s1'), Session('s2', alive=False)
+    user = cache.get('bob', alive)
+    assert cache.get('bob', ended) is user
+    assert user.session(ended).isAlive() is False
+    assert dead == [ended]
+    assert user.isAlive()
+    assert len(user) == 2
+
+
+def test_user_is_not_alive_once_every_session_ended():
+    cache = LivenessCache(ttl=60)
+    user = cache.get('bob', Session('s1', alive=False))
+    cache.get('bob', Session('s2', alive=False))
+    assert not user.isAlive()
+
+
+def test_user_liveness_is_checked_without_blocking():
+    cache = LivenessCache(ttl=60)
+    checking, slow = Ice.Future(), Session('s1')
+    slow.isAliveAsync = lambda: checking
+    user = cache.get('bob', slow)
+    cache.get('bob', Session('s2', alive=False))
+    alive = user.isAliveAsync()
+    assert not alive.done()
+    checking.set_result(True)
+    assert alive.result(1) is True
+    assert user.isAliveAsync().result(1) is True  # Cached now
+
+
+def test_liveness_keeps_the_most_recent_users():
+    cache = LivenessCache(ttl=60, maxUsers=2)
+    alice = cache.get('alice', Session('s1'))
+    cache.get('bob', Session('s2'))
+    assert cache.get('alice', Session('s3')) is alice
+    cache.get('carol', Session('s4'))  # Over the size, bob goes
+    assert cache.stats()['users'] == 2
+    assert cache.get('alice', Session('s1')) is alice
+
+    idle = LivenessCache(ttl=60, idleTtl=0)
+    idle.get('alice', Session('s1'))
+    idle.get('bob', Session('s2'))
+    assert idle.stats()['users'] == 1
+
+
+def test_liveness_of_an_evicted_tree_is_forgotten(service):
+    service.roots.maxTrees = 1
+    trees = {username: service.loadRoot(service.genUUID(username), username, None,
+                                        service.liveness.get(username, Session(username)))
+             for username in ('alice', 'bob')}
+    assert trees['alice'].closed
+    assert 'alice' not in service.liveness.users and 'bob' in service.liveness.users
+
+
+def test_verified_users_expire_and_are_invalidated():
+    cache = VerifiedCache(maxUsers=2, ttl=60)
+    first, second, third = FakeProxy('u1'), FakeProxy('u2'), FakeProxy('u3')
+    cache.put(first, 'alice')
+    assert cache.get(first) == 'alice'
+    cache.invalidate(first)
+    assert cache.get(first) is None
+
+    cache.put(first, 'alice')
+    cache.put(second, 'bob')
+    cache.put(third, 'carol')  # Over the size, the least recently used goes
+    assert cache.get(first) is None and cache.get(third) == 'carol'
+
+    expired = VerifiedCache(ttl=0)
+    expired.put(first, 'alice')
+    assert expired.get(first) is None
+
+
+def test_root_cache_evicts_the_least_recently_used():
+    evicted = []
+    cache = RootCache(maxTrees=2, onEvict=lambda uuid, root: evicted.append(uuid))
+    cache.put('a', Tree())
+    cache.put('b', Tree())
+    cache.get('a')
+    cache.put('c', Tree())
+    assert evicted == ['b']
+    assert cache.get('b') is None and cache.get('a') is not None
+
+
+def test_root_cache_is_bounded_by_directories():
+    evicted = []
+    cache = RootCache(maxTrees=10, maxNodes=100, onEvict=lambda uuid, root: evicted.append(uuid))
+    cache.put('a', Tree(60))
+    cache.put('b', Tree(60))
+    assert evicted == ['a']
+
+
+def test_root_cache_counts_one_lookup_per_get_root(service):
+    for _ in range(2):
+        service.rootProxy('bob', None, Alive(), True, Adapter())
+    stats = service.roots.stats()
+    assert (stats['misses'], stats['hits'], stats['trees']) == (1, 1, 1)
+
+
+def test_root_cache_keeps_busy_trees():
+    cache = RootCache(maxTrees=1, onEvict=lambda uuid, root: uuid != 'busy')
+    cache.put('busy', Tree())
+    cache.put('b', Tree())
+    assert cache.get('busy') is not None
+    cache.put('c', Tree())
+    assert cache.get('b') is None
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,158 @@
+"""Tests of the Directory servant: file links, bulk calls and eviction of busy trees."""
+
+import threading
+import time
+
+import Ice
+import IceDrive
+import pytest
+
+from icedrive_directory.directory import Directory
+from tests.helpers import Alive, Current, FakeProxy
+
+
+def logged(root):
+    """Mutations logged so far"""
+    return root.storage.seq
+
+
+def test_link_is_logged_once_confirmed(root, blob):
+    root.blobs.window = 10
+    before = logged(root)
+    linking = root.linkFile('f', 'B')
+    assert root.getFiles() == ['f'] and logged(root) == before
+    assert 'f' not in root.serialize()['files']  # Never in a snapshot before it is logged
+
+    root.blobs.flush()
+    assert linking.result(1) is None
+    assert logged(root) == before + 1 and blob.refs['B'] == 1
+
+
+def test_unlink_before_confirmation_calls_the_link_off(root, blob):
+    root.blobs.window = 10
+    before = logged(root)
+    linking = root.linkFile('tmp', 'B')
+    assert root.unlinkFile('tmp').result(1) is None
+    root.blobs.flush()
+    assert linking.result(1) is None
+    assert blob.calls == 0 and logged(root) == before and root.getFiles() == []
+
+
+def test_unlink_after_the_link_left_gives_the_reference_back(root, blob):
+    blob.hold = True
+    root.blobs.window = 10
+    linking = root.linkFile('tmp', 'B')
+    root.blobs.flush()  # The link is on its way
+    unlinking = root.unlinkFile('tmp')
+    blob.release()
+    root.blobs.flush()
+    blob.release()
+    assert linking.result(1) is None and unlinking.result(1) is None
+    assert blob.refs['B'] == 0 and root.getFiles() == []
+
+
+def test_finishing_a_link_does_not_deadlock_a_bulk_unlink(root, blob):
+    root.blobs.window = 10
+    with root.lock.writing():
+        root.files['old'] = 'B'
+    linking = root.linkFile('new', 'B')
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: root.unlinkFiles(['old']).result(2) and done.set())
+    thread.start()
+    while root.blobs.stats()['queued'] < 2 and thread.is_alive():  # The unlink must be queued too
+        time.sleep(0.001)
+    root.blobs.flush()
+    thread.join(3)
+    assert done.is_set() and linking.result(1) is None
+
+
+def test_names_with_slashes_are_separate_directories(root):
+    root.createChildren(['a/b', 'a'])
+    root.child('a/b').createChild('c', Current())
+    assert root.find('a%2Fb/c') is not None
+    assert root.find('a/b') is None
+
+
+def test_reserved_names_are_not_children(root):
+    for name in Directory.RESERVED:
+        with pytest.raises(IceDrive.ChildAlreadyExists):
+            root.createChild(name, Current())
+    results = root.createChildren(['', 'a', '..'])
+    assert [result.ok for result in results] == [False, True, False]
+    assert list(root.childs) == ['a']
+
+
+def test_duplicate_and_missing_files(root, blob):
+    root.linkFile('f', 'B').result(1)
+    with pytest.raises(IceDrive.FileAlreadyExists):
+        root.linkFile('f', 'C').result(1)
+    with pytest.raises(IceDrive.FileNotFound):
+        root.unlinkFile('g').result(1)
+
+
+def test_concurrent_unlinks_send_one_blob_unlink(root, blob):
+    root.linkFile('f', 'B').result(1)
+    root.blobs.window = 10
+    first = root.unlinkFile('f')
+    with pytest.raises(IceDrive.FileNotFound):
+        root.unlinkFile('f').result(1)
+    assert root.unlinkFiles(['f']).result(1)[0].error == 'FileNotFound'
+    root.blobs.flush()
+    assert first.result(1) is None
+    assert blob.calls == 2 and blob.refs['B'] == 0 and root.getFiles() == []
+
+
+def test_link_waits_for_the_liveness_check_without_blocking(service, blob):
+    checking, session = Ice.Future(), FakeProxy('s1')
+    session.isAliveAsync = lambda: checking
+    root = service.loadRoot(service.genUUID('alice'), 'alice', None, service.liveness.get('alice', session))
+    linking = root.linkFile('f', 'B')
+    assert not linking.done() and blob.calls == 0
+    checking.set_result(False)
+    with pytest.raises(IceDrive.Unauthorized):
+        linking.result(1)
+    assert blob.calls == 0 and root.files == {}
+
+
+def test_bulk_calls_return_one_result_per_item(root, blob):
+    results = root.linkFiles({'a': 'A', 'b': 'B'}).result(1)
+    assert [(result.name, result.ok) for result in results] == [('a', True), ('b', True)]
+    results = root.unlinkFiles(['a', 'zz', 'a']).result(1)
+    assert [(result.name, result.ok, result.error) for result in results] == [
+        ('a', True, ''), ('zz', False, 'FileNotFound'), ('a', False, 'FileNotFound')]
+    assert root.getFiles() == ['b']
+
+
+def test_link_without_blob_service_leaves_nothing_behind(root, blob, monkeypatch):
+    enqueue, calls = root.blobs.enqueue, []
+
+    def failSecond(operation, blob_id, future=None):
+        calls.append(blob_id)
+        if len(calls) == 2:
+            raise IceDrive.TemporaryUnavailable('Blob Service')
+        return enqueue(operation, blob_id, future)
+
+    monkeypatch.setattr(root.blobs, 'enqueue', failSecond)
+    results = root.linkFiles({'a': 'A', 'b': 'B', 'c': 'C'}).result(1)
+    monkeypatch.undo()
+    root.blobs.flush()
+    assert {result.error for result in results} == {'TemporaryUnavailable'}
+    assert root.getFiles() == [] and blob.refs['A'] == 0
+
+
+def test_busy_tree_is_not_evicted(service, blob):
+    service.roots.maxTrees = 1
+    busy = service.loadRoot(service.genUUID('alice'), 'alice', None, Alive())
+    blob.hold = True
+    linking = busy.linkFile('f', 'B')
+    busy.blobs.flush()
+
+    service.loadRoot(service.genUUID('bob'), 'bob', None, Alive())
+    assert service.roots.get(busy.uuid) is busy and not busy.closed
+    blob.release()
+    assert linking.result(1) is None
+
+    service.loadRoot(service.genUUID('carol'), 'carol', None, Alive())
+    assert busy.closed
+    with pytest.raises(Ice.ObjectNotExistException):
+        busy.createChild('late', Current())
@@ -0,0 +1,104 @@
+"""Tests of the append-only journal: group commit, replay, torn writes and compaction."""
+
+import json
+import threading
+
+import pytest
+
+from icedrive_directory.directory import Directory, DirectoryService
+from icedrive_directory.journal import Journal
+from tests.helpers import Alive, Current
+
+
+def newRoot(path, uuid='u', **options):
+    """Create the journal and the root of a new tree in path"""
+    journal = Journal(str(path), uuid, **options)
+    root = Directory('root', None, storage=journal, username='bob')
+    journal.create(root)
+    return journal, root
+
+
+def reload(service, username='bob'):
+    """Load a tree again from disk, as a new instance would"""
+    return DirectoryService().loadRoot(service.genUUID(username), username, None, Alive())
+
+
+def logLines(journal):
+    """Entries currently in the log file"""
+    with open(journal.logPath, encoding='utf-8') as log_file:
+        return [json.loads(line) for line in log_file]
+
+
+def test_concurrent_appends_share_a_flush(tmp_path):
+    journal, root = newRoot(tmp_path, flushWindow=0.05)
+    writes = []
+    writeLog = journal.writeLog
+    journal.writeLog = lambda batch: writes.append(len(batch)) or writeLog(batch)
+    start = threading.Barrier(8)
+
+    def append(i):
+        start.wait()
+        journal.appendMany([{'op': 'mkdir', 'path': '', 'name': f'd{i}'}], root)
+
+    threads = [threading.Thread(target=append, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(writes) == 8
+    assert len(writes) < 8
+    assert journal.durable == journal.seq == 8
+    assert sorted(entry['seq'] for entry in logLines(journal)) == list(range(1, 9))
+
+
+def test_enqueue_is_durable_only_after_sync(tmp_path):
+    journal, root = newRoot(tmp_path)
+    ticket = journal.enqueue([{'op': 'mkdir', 'path': '', 'name': 'a'}], root)
+    assert journal.durable < ticket
+    journal.sync(ticket)
+    assert journal.durable == ticket
+    assert [entry['name'] for entry in logLines(journal)] == ['a']
+
+
+def test_replay_applies_the_log_after_the_snapshot(service, root):
+    root.createChildren(['a', 'b', 'c'])
+    root.removeChild('a')
+    root.child('b').createChild('x', Current())
+    assert len(logLines(root.storage)) == 5
+
+    loaded = reload(service)
+    assert sorted(loaded.childs) == ['b', 'c']
+    assert list(loaded.child('b').childs) == ['x']
+    assert loaded.storage.seq == 5
+
+
+def test_torn_write_keeps_the_entries_before_it(service, root):
+    root.createChildren(['a', 'b'])
+    with open(root.storage.logPath, 'a', encoding='utf-8') as log_file:
+        log_file.write('{"seq": 3, "op": "mkd')  # Crash in the middle of a write
+
+    loaded = reload(service)
+    assert sorted(loaded.childs) == ['a', 'b']
+    assert logLines(loaded.storage) == []  # Folded into a new snapshot
+    with open(loaded.storage.snapshotPath, encoding='utf-8') as snapshot:
+        assert json.load(snapshot)['seq'] == 2
+
+
+def test_compaction_bounds_the_log(service, root):
+    root.storage.compactEvery = 5
+    for i in range(12):
+        root.createChild(f'd{i}', Current())
+
+    assert root.storage.pending < 5
+    assert len(logLines(root.storage)) == root.storage.pending
+    loaded = reload(service)
+    assert len(loaded.childs) == 12
+    assert loaded.storage.seq == 12
+
+
+def test_closed_journal_refuses_entries(tmp_path):
+    journal, root = newRoot(tmp_path)
+    journal.close()
+    with pytest.raises(ValueError):
+        journal.enqueue([{'op': 'mkdir', 'path': '', 'name': 'a'}], root)
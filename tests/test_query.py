@@ -0,0 +1,111 @@
+"""Tests of the answers to the DirectoryQuery published by other instances."""
+
+import IceDrive
+import pytest
+
+from icedrive_directory.delayed_response import DirectoryQuery
+from icedrive_directory.directory import DirectoryService
+from icedrive_directory.futures import completed
+from tests.helpers import Adapter, Alive, FakeProxy
+
+
+class FakeUser(FakeProxy):
+    """UserPrx stand-in, maybe forged by whoever published the query"""
+
+    def __init__(self, name, username, alive=True):
+        """Create the user"""
+        super().__init__(name)
+        self.username = username
+        self.alive = alive
+
+    def ice_invocationTimeout(self, timeout):
+        """The same proxy"""
+        return self
+
+    def getUsernameAsync(self):
+        """Username it claims"""
+        return completed(self.username)
+
+    def isAliveAsync(self):
+        """Liveness of the session"""
+        return completed(self.alive)
+
+
+class FakeAuthentication(FakeProxy):
+    """AuthenticationPrx stand-in knowing the genuine User proxies"""
+
+    def __init__(self, *genuine):
+        """Create the service"""
+        super().__init__('auth')
+        self.genuine = {user.identity for user in genuine}
+        self.calls = 0
+
+    def ice_invocationTimeout(self, timeout):
+        """The same proxy"""
+        return self
+
+    def verifyUserAsync(self, user):
+        """Check the user was issued by this service"""
+        self.calls += 1
+        return completed(user.identity in self.genuine)
+
+
+class Response:
+    """DirectoryQueryResponsePrx stand-in recording the answers"""
+
+    def __init__(self):
+        """Create the response"""
+        self.roots = []
+
+    def rootDirectoryResponseAsync(self, root):
+        """Record an answer"""
+        self.roots.append(root)
+
+
+@pytest.fixture
+def stored(workdir):
+    """A service storing the tree of bob, not loaded yet"""
+    first = DirectoryService()
+    first.loadRoot(first.genUUID('bob'), 'bob', None, Alive())
+    first.shutdown()
+    service = DirectoryService()
+    yield service
+    service.shutdown()
+
+
+def ask(service, user):
+    """Receive a query for the root of user, returning the answers sent"""
+    response = Response()
+    DirectoryQuery(service, Adapter()).rootDirectory(user, response).result(1)
+    return response.roots
+
+
+def test_verified_live_user_gets_the_root(stored, registries):
+    user = FakeUser('s1', 'bob')
+    registries.authenticators.announce(FakeAuthentication(user))
+    assert ask(stored, user) == [None]  # The proxy built by the Adapter stand-in
+    assert stored.roots.peek(stored.genUUID('bob')) is not None
+
+
+def test_forged_user_gets_nothing_and_is_not_a_session(stored, registries):
+    registries.authenticators.announce(FakeAuthentication())
+    with pytest.raises(IceDrive.Unauthorized):
+        ask(stored, FakeUser('forged', 'bob'))
+    assert stored.roots.peek(stored.genUUID('bob')) is None
+    assert 'bob' not in stored.liveness.users
+
+
+def test_dead_session_gets_nothing(stored, registries):
+    user = FakeUser('s1', 'bob', alive=False)
+    registries.authenticators.announce(FakeAuthentication(user))
+    with pytest.raises(IceDrive.Unauthorized):
+        ask(stored, user)
+    assert stored.roots.peek(stored.genUUID('bob')) is None
+
+
+def test_instance_without_the_tree_verifies_nobody(stored, registries):
+    user = FakeUser('s1', 'alice')
+    authentication = FakeAuthentication(user)
+    registries.authenticators.announce(authentication)
+    assert ask(stored, user) == []
+    assert authentication.calls == 0
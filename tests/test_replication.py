@@ -0,0 +1,95 @@
+"""Tests of the replication of the trees to their backup instances."""
+
+import json
+
+import IceDrive
+import pytest
+
+from icedrive_directory.directory import Directory
+from icedrive_directory.futures import completed
+from icedrive_directory.journal import Journal
+from icedrive_directory.replication import ReplicaStore
+from tests.helpers import Current
+
+TREE = json.dumps({'name': 'root', 'user': 'bob', 'files': {'f': 'F'},
+                   'childs': {'a': {'name': 'a', 'user': 'bob', 'files': {}, 'childs': {}}}})
+
+
+class Backup:
+    """DirectoryReplicaPrx stand-in calling a ReplicaStore, counting the calls"""
+
+    def __init__(self, store):
+        """Create the backup"""
+        self.store = store
+        self.answers = []  # Answers to replicate()
+        self.installs = 0
+
+    def replicateAsync(self, uuid, username, epoch, firstSeq, mutations):
+        """Apply a batch"""
+        self.answers.append(self.store.replicate(uuid, username, epoch, firstSeq, mutations))
+        return completed(self.answers[-1])
+
+    def installAsync(self, uuid, username, epoch, seq, tree):
+        """Receive the whole tree"""
+        self.installs += 1
+        self.store.install(uuid, username, epoch, seq, tree)
+        return completed(None)
+
+
+def mkdir(seq, name, path=''):
+    """Mutation creating a directory"""
+    return IceDrive.Mutation(seq, 'mkdir', path, name, '')
+
+
+@pytest.fixture
+def store(tmp_path):
+    """An empty ReplicaStore"""
+    return ReplicaStore(str(tmp_path / 'replicas'))
+
+
+def test_unknown_tree_asks_for_an_install(store):
+    assert store.replicate('u', 'bob', 'e1', 1, [mkdir(1, 'a')]) == -1
+    assert not store.has('u')
+
+
+def test_batches_apply_after_an_install(store):
+    store.install('u', 'bob', 'e1', 2, TREE)
+    assert store.replicate('u', 'bob', 'e1', 3, [mkdir(3, 'b'), mkdir(4, 'c', 'b')]) == 4
+    assert store.replicate('u', 'bob', 'e1', 3, [mkdir(3, 'b'), mkdir(4, 'c', 'b')]) == 4  # Resent
+    root = store.open('u', 'bob')
+    assert sorted(root.childs) == ['a', 'b'] and list(root.child('b').childs) == ['c']
+
+
+def test_gap_or_new_epoch_asks_for_an_install(store):
+    store.install('u', 'bob', 'e1', 2, TREE)
+    assert store.replicate('u', 'bob', 'e1', 5, [mkdir(5, 'b')]) == -1  # Missed 3 and 4
+    assert store.replicate('u', 'bob', 'e2', 3, [mkdir(3, 'b')]) == -1  # Primary loaded the tree again
+
+
+def test_primary_installs_then_streams_the_mutations(service, root, store):
+    backup = Backup(store)
+    service.replicator.backupsOf = lambda uuid: [backup]
+    root.createChildren(['a', 'b'])
+    service.replicator.flush()
+    assert backup.answers == [-1] and backup.installs == 1
+
+    root.child('a').createChild('x', Current())
+    root.removeChild('b')
+    service.replicator.flush()
+    assert backup.answers[-1] == 4 and backup.installs == 1
+    replica = store.open(root.uuid, 'bob')
+    assert list(replica.childs) == ['a'] and list(replica.child('a').childs) == ['x']
+
+
+def test_promoted_replica_becomes_the_primary_tree(store, tmp_path):
+    store.install('u', 'bob', 'e1', 2, TREE)
+    store.replicate('u', 'bob', 'e1', 3, [mkdir(3, 'b')])
+    primary = tmp_path / 'primary'
+    primary.mkdir()
+    storage = Journal(str(primary), 'u')
+    store.promote('u', 'bob', storage)
+
+    assert not store.has('u')
+    root = Directory('root', None, storage=storage, username='bob')
+    storage.load(root)
+    assert sorted(root.childs) == ['a', 'b'] and root.files == {'f': 'F'}
@@ -0,0 +1,71 @@
+"""Tests of the consistent-hash ring of Directory instances."""
+
+import pytest
+
+from icedrive_directory.discovery import ServiceRegistry
+from icedrive_directory.ring import HashRing
+from tests.helpers import FakeProxy
+
+KEYS = [f'user{i}' for i in range(2000)]
+
+
+def owners(ring):
+    """Owner of every key"""
+    return {key: ring.owner(key).identity.name for key in KEYS}
+
+
+@pytest.fixture
+def registry():
+    """Four announced instances"""
+    instances = ServiceRegistry()
+    for i in range(4):
+        instances.announce(FakeProxy(f's{i}'))
+    return instances
+
+
+def test_empty_ring_has_no_owner():
+    ring = HashRing()
+    ring.update(ServiceRegistry())
+    assert ring.owner('user') is None
+
+
+def test_keys_are_spread_over_the_instances(registry):
+    ring = HashRing(100)
+    ring.update(registry)
+    counts = {}
+    for owner in owners(ring).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {'s0', 's1', 's2', 's3'}
+    assert min(counts.values()) > len(KEYS) / 4 * 0.6
+
+
+def test_join_only_moves_keys_to_the_new_instance(registry):
+    ring = HashRing(100)
+    ring.update(registry)
+    before = owners(ring)
+    registry.announce(FakeProxy('s4'))
+    ring.update(registry)
+    after = owners(ring)
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 's4' for key in moved)
+    assert len(moved) < len(KEYS) / 5 * 1.5
+
+
+def test_leave_only_moves_the_keys_of_the_instance(registry):
+    ring = HashRing(100)
+    ring.update(registry)
+    before = owners(ring)
+    registry.remove(FakeProxy('s1'))
+    ring.update(registry)
+    after = owners(ring)
+
+    assert all(before[key] == 's1' for key in KEYS if before[key] != after[key])
+
+
+def test_successors_are_distinct_and_start_with_the_owner(registry):
+    ring = HashRing(100)
+    ring.update(registry)
+    successors = ring.successors('user1', 3)
+    assert successors[0] is ring.owner('user1')
+    assert len({prx.identity.name for prx in successors}) == 3
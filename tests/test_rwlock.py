@@ -0,0 +1,72 @@
+"""Tests of the reader/writer lock of the trees."""
+
+import threading
+
+from icedrive_directory.rwlock import ReadWriteLock
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    both = threading.Barrier(2, timeout=2)
+
+    def read():
+        with lock.reading():
+            both.wait()  # Only passes if the two readers hold the lock at once
+
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not both.broken
+
+
+def test_writer_excludes_readers():
+    lock = ReadWriteLock()
+    read = threading.Event()
+
+    def reader():
+        with lock.reading():
+            read.set()
+
+    with lock.writing():
+        thread = threading.Thread(target=reader)
+        thread.start()
+        assert not read.wait(0.1)
+    assert read.wait(2)
+    thread.join()
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    order = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def firstReader():
+        with lock.reading():
+            reading.set()
+            release.wait(2)
+        order.append('first reader')
+
+    def writer():
+        with lock.writing():
+            order.append('writer')
+
+    def lateReader():
+        with lock.reading():
+            order.append('late reader')
+
+    threads = [threading.Thread(target=firstReader)]
+    threads[0].start()
+    reading.wait(2)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    while not lock.waiting:  # The writer is queued behind the first reader
+        threading.Event().wait(0.01)
+    threads.append(threading.Thread(target=lateReader))
+    threads[2].start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order.index('writer') < order.index('late reader')
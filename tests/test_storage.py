@@ -0,0 +1,128 @@
+"""Tests of the SQLite backend and of the encoding of directory paths."""
+
+import Ice
+import pytest
+
+from icedrive_directory.directory import Directory, DirectoryService
+from icedrive_directory.storage import SqliteDatabase, SqliteStorage, joinPath, splitPath
+from tests.helpers import Alive
+
+
+@pytest.fixture
+def database(tmp_path):
+    """An empty database"""
+    db = SqliteDatabase(str(tmp_path / 'directories.db'))
+    yield db
+    db.close()
+
+
+def newTree(database, uuid='u'):
+    """Create the storage and the root of a new tree"""
+    storage = SqliteStorage(database, uuid, 'bob')
+    root = Directory('root', None, storage=storage, username='bob')
+    storage.create(root)
+    return storage, root
+
+
+def mkdir(path, name):
+    """Entry creating a directory"""
+    return {'op': 'mkdir', 'path': path, 'name': name}
+
+
+def append(storage, root, *entries):
+    """Log entries one at a time, a batch only ever touches one directory"""
+    for entry in entries:
+        storage.appendMany([entry], root)
+
+
+def count(database, table):
+    """Rows in a table"""
+    return database.query(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+
+def test_rmdir_deletes_the_whole_subtree(database):
+    storage, root = newTree(database)
+    other, other_root = newTree(database, 'v')
+    append(storage, root, mkdir('', 'a'), mkdir('a', 'b'), mkdir('a/b', 'c'), mkdir('', 'keep'),
+           {'op': 'link', 'path': 'a/b', 'name': 'f', 'blobId': 'B'},
+           {'op': 'link', 'path': '', 'name': 'g', 'blobId': 'G'})
+    append(other, other_root, mkdir('', 'a'))
+    assert count(database, 'nodes') == 7
+
+    storage.appendMany([{'op': 'rmdir', 'path': '', 'name': 'a'}], root)
+
+    assert storage.resolve('a') is None and storage.resolve('a/b/c') is None
+    assert storage.materialize(storage.resolve(''))[0] == {'g': 'G'}
+    assert sorted(storage.materialize(storage.resolve(''))[1]) == ['keep']
+    assert count(database, 'nodes') == 4  # Both roots, keep and the a of the other user
+    assert count(database, 'files') == 1
+    assert other.resolve('a') is not None
+
+
+def test_resolved_ids_are_cached_until_removed(database):
+    storage, root = newTree(database)
+    append(storage, root, mkdir('', 'a'), mkdir('a', 'b'))
+    node_id = storage.resolve('a/b')
+
+    queries = []
+    query = database.query
+    database.query = lambda sql, args=(): queries.append(sql) or query(sql, args)
+    assert storage.resolve('a/b') == node_id
+    assert queries == []
+
+    storage.appendMany([{'op': 'rmdir', 'path': '', 'name': 'a'}], root)
+    assert 'a' not in storage.ids and 'a/b' not in storage.ids
+    assert storage.resolve('a/b') is None
+
+
+def test_mutations_of_a_removed_directory_are_skipped(database):
+    storage, root = newTree(database)
+    append(storage, root, mkdir('', 'a'), mkdir('', 'keep'))
+    storage.appendMany([{'op': 'rmdir', 'path': '', 'name': 'a'}], root)
+    storage.appendMany([mkdir('a', 'b'), {'op': 'link', 'path': 'a', 'name': 'f', 'blobId': 'B'},
+                        {'op': 'link', 'path': 'keep', 'name': 'g', 'blobId': 'G'}], root)
+    assert count(database, 'nodes') == 2 and count(database, 'files') == 1
+
+
+def test_link_confirmed_after_removing_its_directory(workdir, blob):
+    properties = Ice.createProperties()
+    properties.setProperty('Directory.Storage', 'sqlite')
+    service = DirectoryService(properties)
+    root = service.loadRoot(service.genUUID('bob'), 'bob', None, Alive())
+    root.blobs.window = 10
+    root.createChildren(['d'])
+    linking = root.child('d').linkFile('f', 'B')
+    root.removeChild('d')
+    root.blobs.flush()
+    assert linking.result(1) is None
+    root.createChildren(['e'])  # The storage is still usable
+    service.shutdown()
+    assert list(DirectoryService(properties).loadRoot(service.genUUID('bob'), 'bob', None, Alive()).childs) == ['e']
+
+
+def test_subtree_stops_at_max_depth(database):
+    storage, root = newTree(database)
+    append(storage, root, mkdir('', 'a'), mkdir('a', 'b'), mkdir('a/b', 'c'))
+    subtree = storage.subtree(storage.resolve('a'), maxDepth=1)
+    assert subtree['childs']['b']['childs'] == {'c': None}
+
+
+def test_names_with_slashes_round_trip():
+    path = joinPath(joinPath('', 'a/b'), '100%')
+    assert path == 'a%2Fb/100%25'
+    assert splitPath(path) == ['a/b', '100%']
+
+
+def test_sqlite_service_stores_names_with_slashes(workdir):
+    properties = Ice.createProperties()
+    properties.setProperty('Directory.Storage', 'sqlite')
+    service = DirectoryService(properties)
+    root = service.loadRoot(service.genUUID('bob'), 'bob', None, Alive())
+    root.createChildren(['a/b', 'a'])
+    root.child('a/b').createChildren(['c'])
+
+    loaded = DirectoryService(properties).loadRoot(service.genUUID('bob'), 'bob', None, Alive())
+    assert sorted(loaded.childs) == ['a', 'a/b']
+    assert list(loaded.child('a/b').childs) == ['c']
+    assert list(loaded.child('a').childs) == []
+    service.shutdown()